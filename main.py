@@ -1,40 +1,216 @@
 import asyncio
+import json
 import logging
 import os
+import pathlib
+import time
+
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Awaitable, Optional, TypeVar
 
 from dotenv import load_dotenv
 
 load_dotenv()  # noqa: E402
 
+import httpx
+
 from fastapi.middleware.cors import CORSMiddleware
 
-from models.index import ChatMessage
-from providers.rag_agent import AIAgent
-from providers.providers import LMStudioProvider, TogetherProvider
+from models.index import BatchRequest, ChatMessage
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.metrics import (CHAT_SESSIONS, CONTENT_TYPE, QUEUE_DEPTH, REGISTRY, REQUEST_SECONDS, REQUESTS_CANCELLED,
+                           REQUESTS_IN_FLIGHT, StageMetrics, server_timing)
+from utils.profiling import (PROFILE_HEADER, PROFILE_QUERY_PARAM, PROFILE_TOKEN, is_authorized, list_profiles,
+                             profile_file, profiled)
+from utils.timing import add_stage_listener, start_timings
 
-from utils.index import get_finished_headless_dialogs, prepend_to_file
+if TYPE_CHECKING:
+    from providers.rag_agent import AIAgent
 
 logger = logging.getLogger("uvicorn")
+T = TypeVar("T")
+
+# Send a request through embedding, retrieval and generation before reporting ready; retry every
+# WARMUP_RETRY_SECONDS while a backend is unavailable
+WARMUP = os.environ.get('WARMUP', '1').lower() in ('1', 'true', 'yes')
+WARMUP_RETRY_SECONDS = float(os.environ.get('WARMUP_RETRY_SECONDS', 10))
+# Non-standard status logged for requests whose client went away, as nginx does
+CLIENT_CLOSED_REQUEST = 499
+
+# Created by the lifespan in the background, so the server answers /ready while langchain loads
+llm: Optional["AIAgent"] = None
+ready = False
+background_tasks = set()
+
+
+async def start() -> None:
+    """
+    Build the agent off the event loop, start the dialog handler and warm up, then report ready.
+    """
+    global llm, ready
+    started = time.perf_counter()
+    try:
+        llm = await asyncio.to_thread(create_agent)
+    except Exception:
+        logger.exception("Could not create the agent")
+        raise
+    background_tasks.add(asyncio.create_task(timer()))
+    logger.info(f"Agent created in {time.perf_counter() - started:.1f}s")
+
+    while WARMUP:
+        try:
+            await llm.warmup()
+            break
+        except Exception as ex:
+            logger.warning(f"Warmup failed, retrying in {WARMUP_RETRY_SECONDS}s: {ex!r}")
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+    ready = True
+    logger.info(f"Ready in {time.perf_counter() - started:.1f}s")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """
+    Start in the background and shut down cleanly: stop the startup and dialog handler tasks,
+    finish background summaries and close the embedding client.
+    """
+    background_tasks.add(asyncio.create_task(start()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if llm is not None:
+        await llm.aclose()
+
+
+def agent() -> "AIAgent":
+    """
+    :return: The agent, once warmed up.
+    :raises HTTPException: 503 while starting.
+    """
+    if not ready:
+        raise HTTPException(status_code=503, detail="Starting up", headers={"Retry-After": str(int(WARMUP_RETRY_SECONDS))})
+    return llm
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile"],
 )
+add_stage_listener(StageMetrics())
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    """
+    Collects per-stage timings of the request, records request metrics and adds a ``Server-Timing`` header.
+    """
+    timings = start_timings()
+    started = time.perf_counter()
+    with REQUESTS_IN_FLIGHT.track_inprogress():
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
 
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(elapsed, method=request.method, path=getattr(route, "path", "unmatched"),
+                            status=response.status_code)
+    response.headers["Server-Timing"] = server_timing(timings, elapsed)
+    return response
+
+
+class ProfilingMiddleware:
+    """
+    Runs the request under cProfile and tracemalloc when it carries a valid profiling token,
+    in the ``X-Profile-Token`` header or the ``profile`` query parameter.
+
+    A plain ASGI middleware, so a streamed body is profiled until its last chunk rather than only up to
+    the response headers; the ``X-Profile`` header names the profile that will be stored. Requests
+    without a token and admin requests pass straight through. Only installed when ``PROFILE_TOKEN`` is set.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-model = LMStudioProvider(host=os.environ.get('LM_STUDIO_HOST'), model_name="qwen/qwen3-8b")
-free_model = LMStudioProvider(host=os.environ.get('LM_STUDIO_HOST'), model_name="qwen/qwen3-8b", temperature=0.5)
-# model = TogetherProvider(model_name="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free")
-# free_model = TogetherProvider(model_name="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free", temperature=0.5)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith("/admin/"):
+            return await self.app(scope, receive, send)
 
-llm = AIAgent(model=model, free_model=free_model)
+        request = Request(scope)
+        token = request.headers.get(PROFILE_HEADER) or request.query_params.get(PROFILE_QUERY_PARAM)
+        if not token or not is_authorized(token):
+            return await self.app(scope, receive, send)
+
+        async with profiled(scope["path"]) as profile_name:
+            async def send_with_profile(message: Message):
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message).append("X-Profile", profile_name or "busy")
+                await send(message)
+
+            await self.app(scope, receive, send_with_profile)
+
+
+if PROFILE_TOKEN:
+    app.add_middleware(ProfilingMiddleware)
+
+
+def require_profile_token(request: Request):
+    if not is_authorized(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=404)
+
+
+def create_agent() -> "AIAgent":
+    """
+    Build the agent for the provider selected by ``LLM_PROVIDER``.
+
+    Providers and langchain are imported here rather than at module level, so the app itself starts fast.
+
+    - ``lmstudio`` (default): local LM Studio model and Ollama embeddings
+    - ``together``: Together.ai model and Ollama embeddings
+    - ``fake``: deterministic stand-in LLM and embeddings over a generated fixture corpus, for load tests;
+      latencies are set with ``FAKE_LLM_LATENCY`` and ``FAKE_EMBED_LATENCY`` (seconds)
+
+    :return: AIAgent
+    """
+    from providers.rag_agent import AIAgent
+
+    provider = os.environ.get('LLM_PROVIDER', 'lmstudio')
+
+    if provider == 'fake':
+        from providers.fake import FakeEmbeddings, FakeProvider
+        from scripts.bench_fixtures import build_fixture_corpus
+
+        fixture_path = f"{pathlib.Path(__file__).parent.resolve()}/tmp/fixture_chroma"
+        if not os.path.exists(fixture_path):
+            build_fixture_corpus(fixture_path)
+
+        latency = float(os.environ.get('FAKE_LLM_LATENCY', 0.5))
+        return AIAgent(model=FakeProvider(latency=latency),
+                       free_model=FakeProvider(latency=latency),
+                       embeddings=FakeEmbeddings(latency=float(os.environ.get('FAKE_EMBED_LATENCY', 0.02))),
+                       persist_directory=fixture_path,
+                       persist_dialogs=False)
+
+    from providers.providers import LMStudioProvider, TogetherProvider
+
+    if provider == 'together':
+        model = TogetherProvider(model_name="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free")
+        free_model = TogetherProvider(model_name="meta-llama/Llama-3.3-70B-Instruct-Turbo-Free", temperature=0.5)
+    else:
+        model = LMStudioProvider(host=os.environ.get('LM_STUDIO_HOST'), model_name="qwen/qwen3-8b")
+        free_model = LMStudioProvider(host=os.environ.get('LM_STUDIO_HOST'), model_name="qwen/qwen3-8b", temperature=0.5)
+
+    return AIAgent(model=model, free_model=free_model)
 
 
 async def timer():
@@ -50,13 +226,17 @@ async def timer():
 
     :raises Exception: If file access or header generation fails.
     """
+    from utils.index import get_finished_headless_dialogs, prepend_to_file
+
     logger.info("Run dialog handler")
     while True:
         finished_headless_logs = get_finished_headless_dialogs()
         logger.info(f"Found {finished_headless_logs} logs to be managed")
+        QUEUE_DEPTH.set(len(finished_headless_logs), queue="dialog_headers")
         for log_file in finished_headless_logs:
             header = await llm.generate_dialog_header(log_file)
             prepend_to_file(log_file, header.content)
+            QUEUE_DEPTH.dec(queue="dialog_headers")
             logger.info(f"Header was added to the {log_file}")
 
         await asyncio.sleep(60 * 30)  # 30 min delay
@@ -71,9 +251,101 @@ async def read_root():
     return {"Hello": "world"}
 
 
-@app.post("/chat/{chat_id}")
-async def ask(chat_id: str, message: ChatMessage):
-    return {"response": await llm.query(message, chat_id)}
+@app.get("/ready")
+async def readiness():
+    """
+    Readiness probe: 200 once the agent is warmed up, 503 before, so no traffic reaches a cold node.
+    """
+    if not ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready"}
+
+
+@app.get("/admin/profiles")
+async def profiles(request: Request):
+    require_profile_token(request)
+    return {"profiles": list_profiles()}
+
+
+@app.get("/admin/profiles/{name}")
+async def download_profile(name: str, request: Request):
+    require_profile_token(request)
+    path = profile_file(name)
+    if path is None:
+        raise HTTPException(status_code=404)
+    return FileResponse(path, filename=name)
 
 
-asyncio.ensure_future(timer())
+@app.get("/metrics")
+async def metrics():
+    if llm is not None:
+        CHAT_SESSIONS.set(llm.session_count)
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """
+    Run request work as a task and cancel it as soon as the client disconnects, so abandoned requests
+    stop using the GPU.
+
+    :param request: Incoming request.
+    :param work: Coroutine producing the response.
+    :return: Result of the work.
+    :raises HTTPException: 499 if the client disconnected, 504 if the work timed out.
+    """
+    task = asyncio.ensure_future(work)
+
+    async def watch():
+        # The body is already read, so the next ASGI message is the disconnect; waiting for it, as
+        # StreamingResponse does, also works through the HTTP middlewares, unlike Request.is_disconnected()
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.create_task(watch())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            REQUESTS_CANCELLED.inc(reason="disconnect")
+
+    if task.cancelled():
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client disconnected")
+    try:
+        return task.result()
+    except asyncio.TimeoutError:
+        REQUESTS_CANCELLED.inc(reason="deadline")
+        raise HTTPException(status_code=504, detail="The answer took too long, please try again")
+
+
+@app.post("/chat/batch")
+async def ask_batch(batch: BatchRequest, request: Request):
+    """
+    Answer many stateless questions, streaming one JSON line per question as soon as it is answered.
+
+    The questions are embedded and searched before the response starts, so failures there are returned
+    as 503 or 504 instead of a 200 with no lines. Lines hold ``index`` (position in the request), ``id``,
+    ``question`` and either ``answer`` and ``source`` or ``error``. Remaining questions are dropped if
+    the client disconnects.
+    """
+    chat_agent = agent()
+    questions = [item.question for item in batch.questions]
+    try:
+        retrieved = await cancel_on_disconnect(request, chat_agent.retrieve_batch(questions))
+    except (httpx.HTTPError, OSError):
+        logger.exception("Batch retrieval failed")
+        raise HTTPException(status_code=503, detail="The embedding service is unavailable, please try again")
+
+    async def lines():
+        async for result in chat_agent.answer_batch(questions, retrieved):
+            item = batch.questions[result["index"]]
+            yield json.dumps({"id": item.id, "question": item.question, **result}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/chat/{chat_id}")
+async def ask(chat_id: str, message: ChatMessage, request: Request):
+    return {"response": await cancel_on_disconnect(request, agent().query(message, chat_id))}
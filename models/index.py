@@ -1,4 +1,10 @@
-from pydantic import BaseModel, field_validator
+import os
+
+from typing import List, Optional, Union
+
+from pydantic import BaseModel, Field, field_validator
+
+BATCH_MAX_QUESTIONS = int(os.environ.get('BATCH_MAX_QUESTIONS', 500))
 
 
 class ChatMessage(BaseModel):
@@ -9,3 +15,11 @@ class ChatMessage(BaseModel):
         if isinstance(v, str):
             return v[:128]
         return v
+
+
+class BatchQuestion(ChatMessage):
+    id: Optional[Union[str, int]] = None
+
+
+class BatchRequest(BaseModel):
+    questions: List[BatchQuestion] = Field(min_length=1, max_length=BATCH_MAX_QUESTIONS)
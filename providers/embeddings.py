@@ -0,0 +1,163 @@
+import asyncio
+import contextlib
+import os
+
+from typing import List, Optional
+
+import httpx
+
+from langchain_core.embeddings import Embeddings
+
+from utils.metrics import EMBED_BATCH_SIZE, QUEUE_DEPTH
+
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://127.0.0.1:11434')
+EMBED_MODEL = os.environ.get('EMBED_MODEL', 'mxbai-embed-large')
+# Queries arriving within EMBED_MAX_WAIT_MS of the first one are sent together, up to EMBED_MAX_BATCH texts
+EMBED_MAX_BATCH = int(os.environ.get('EMBED_MAX_BATCH', 32))
+EMBED_MAX_WAIT_MS = float(os.environ.get('EMBED_MAX_WAIT_MS', 5))
+EMBED_MAX_IN_FLIGHT = int(os.environ.get('EMBED_MAX_IN_FLIGHT', 4))
+EMBED_TIMEOUT = float(os.environ.get('EMBED_TIMEOUT', 30))
+
+
+class OllamaBatchEmbeddings(Embeddings):
+    """
+    Ollama embeddings over ``/api/embed`` with dynamic micro-batching of concurrent queries.
+
+    Every :meth:`aembed_query` call is queued; a background task collects the queries arriving within
+    ``max_wait_ms`` of the first one, up to ``max_batch``, sends them as one batched request and hands
+    each caller its own vector. Under load the embedding server handles a few large requests instead of
+    one tiny request per chat turn; a lone query waits at most ``max_wait_ms``.
+
+    Requests go through pooled keep-alive connections. ``transport`` replaces the network, e.g. with an
+    ``httpx.MockTransport`` in benchmarks.
+    """
+    def __init__(self, model: str = EMBED_MODEL, base_url: str = OLLAMA_HOST, max_batch: int = EMBED_MAX_BATCH,
+                 max_wait_ms: float = EMBED_MAX_WAIT_MS, max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+                 timeout: float = EMBED_TIMEOUT, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.model = model
+        self.base_url = base_url
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.__transport = transport
+        self.__client: Optional[httpx.AsyncClient] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__queue: Optional[asyncio.Queue] = None
+        self.__batcher: Optional[asyncio.Task] = None
+        self.__in_flight: Optional[asyncio.Semaphore] = None
+
+    async def __start(self) -> None:
+        """
+        Create the client, queue and batcher on the running loop (again if the loop changed), stopping the
+        previous ones first so their connections are not leaked.
+        """
+        loop = asyncio.get_running_loop()
+        if self.__loop is loop and self.__batcher and not self.__batcher.done():
+            return
+
+        await self.__stop()
+        self.__loop = loop
+        self.__client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, transport=self.__transport,
+                                          limits=httpx.Limits(max_keepalive_connections=self.max_in_flight))
+        self.__queue = asyncio.Queue()
+        self.__in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.__batcher = loop.create_task(self.__collect())
+
+    async def __stop(self) -> None:
+        """
+        Stop the batcher and close the pooled connections, on the loop that started them.
+        """
+        if self.__loop is None:
+            return
+        if self.__loop is asyncio.get_running_loop() or self.__loop.is_closed():
+            # Tasks and connections of a closed loop cannot be shut down cleanly; they are freed with it
+            with contextlib.suppress(RuntimeError):
+                self.__batcher.cancel()
+                await self.__client.aclose()
+        else:
+            self.__loop.call_soon_threadsafe(self.__batcher.cancel)
+            asyncio.run_coroutine_threadsafe(self.__client.aclose(), self.__loop)
+        self.__batcher = self.__client = self.__loop = None
+
+    async def __post(self, texts: List[str]) -> List[List[float]]:
+        response = await self.__client.post("/api/embed", json={"model": self.model, "input": texts})
+        response.raise_for_status()
+        embeddings = response.json()["embeddings"]
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings
+
+    async def __collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.__queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.__queue.empty():
+                    batch.append(self.__queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.__queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            QUEUE_DEPTH.set(self.__queue.qsize(), queue="embed")
+            # Callers cancelled while waiting, e.g. on client disconnect, need no embedding
+            batch = [item for item in batch if not item[1].cancelled()]
+            if not batch:
+                continue
+            await self.__in_flight.acquire()
+            loop.create_task(self.__send(batch))
+
+    async def __send(self, batch: list) -> None:
+        try:
+            EMBED_BATCH_SIZE.observe(len(batch))
+            embeddings = await self.__post([text for text, _ in batch])
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+        except Exception as ex:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(ex)
+        finally:
+            self.__in_flight.release()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await self.__start()
+        future = self.__loop.create_future()
+        await self.__queue.put((text, future))
+        return await future
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts that already form a batch, in requests of at most ``max_batch`` texts, bypassing the queue.
+        """
+        await self.__start()
+        embeddings = []
+        for start in range(0, len(texts), self.max_batch):
+            async with self.__in_flight:
+                embeddings.extend(await self.__post(texts[start:start + self.max_batch]))
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        with httpx.Client(base_url=self.base_url, timeout=self.timeout) as client:
+            for start in range(0, len(texts), self.max_batch):
+                response = client.post("/api/embed", json={"model": self.model, "input": texts[start:start + self.max_batch]})
+                response.raise_for_status()
+                embeddings.extend(response.json()["embeddings"])
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aclose(self) -> None:
+        """
+        Stop the batcher and close pooled connections.
+        """
+        await self.__stop()
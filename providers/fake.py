@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+
+from typing import Any, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from providers.providers import LLMProvider
+
+WORD_RE = re.compile(r"\w+")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model with a configurable latency, for benchmarks and load tests.
+
+    Latency is ``latency + latency_per_token * prompt tokens`` so that prompt size shows up in
+    timings the way prefill does on a real model. The reply depends only on the last message.
+    """
+    model_name: str = "fake"
+    latency: float = 0.0
+    latency_per_token: float = 0.0
+    reply_words: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _delay(self, messages: List[BaseMessage]) -> float:
+        prompt_tokens = sum(math.ceil(len(str(message.content)) / 4) for message in messages)
+        return self.latency + self.latency_per_token * prompt_tokens
+
+    def _reply(self, messages: List[BaseMessage]) -> ChatResult:
+        seed = hashlib.md5(str(messages[-1].content).encode()).hexdigest() if messages else ""
+        words = WORD_RE.findall(str(messages[-1].content))[:self.reply_words] if messages else []
+        content = f"[{seed[:8]}] " + " ".join(words)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._delay(messages))
+        return self._reply(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._delay(messages))
+        return self._reply(messages)
+
+
+class FakeProvider(LLMProvider):
+    def invoke(self, query):
+        return self.model.invoke(query)
+
+    def __new__(cls, model_name: str = "fake", latency: float = 0.0, latency_per_token: float = 0.0):
+        return FakeChatModel(model_name=model_name, latency=latency, latency_per_token=latency_per_token)
+
+    async def ainvoke(self, query):
+        return self.model.ainvoke(query)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic hashed bag-of-words embeddings with a configurable latency.
+
+    Texts sharing words get similar vectors, so retrieval over a fixture corpus behaves sensibly
+    without an embedding server. Latency is ``latency + latency_per_text * number of texts`` per call.
+    """
+    def __init__(self, dimensions: int = 256, latency: float = 0.0, latency_per_text: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in WORD_RE.findall(text.lower()):
+            digest = hashlib.md5(word.encode()).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _delay(self, count: int) -> float:
+        return self.latency + self.latency_per_text * count
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self._delay(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(len(texts)))
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
@@ -0,0 +1,95 @@
+from typing import List
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from utils.chunking import count_tokens
+
+# Per-message overhead (role, separators), as in langchain's approximate token counter
+MESSAGE_OVERHEAD_TOKENS = 3
+
+
+def message_tokens(message: BaseMessage) -> int:
+    """
+    Approximate the number of prompt tokens taken by a chat message.
+
+    :param message: Chat message.
+    :return: Token count including the per-message overhead.
+    """
+    return count_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ChatSession:
+    """
+    Chat history of a single session with cached per-message token counts.
+
+    Counts are computed once when a message is appended, so selecting the history window for a
+    prompt is a backwards walk over cached integers instead of re-counting the whole history.
+
+    Older messages can be folded into a running ``summary``; ``summarized`` is the number of leading
+    messages it covers. The messages themselves are kept for the dialog logs.
+    """
+    def __init__(self, messages: List[BaseMessage] = None):
+        self.messages: List[BaseMessage] = []
+        self.token_counts: List[int] = []
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summarized = 0
+        self.summarizing = False
+        for message in messages or []:
+            self.append(message)
+
+    def append(self, message: BaseMessage) -> None:
+        self.messages.append(message)
+        self.token_counts.append(message_tokens(message))
+
+    def window(self, max_tokens: int) -> List[BaseMessage]:
+        """
+        Select the most recent messages that fit into ``max_tokens``, starting on a human message.
+
+        Without a summary this is the same as ``trim_messages(strategy="last", start_on="human",
+        allow_partial=False)``. With one, the summary comes first as a system message and counts against
+        the budget, and messages it already covers are never repeated.
+
+        :param max_tokens: Token budget for the history.
+        :return: Messages in chronological order.
+        """
+        used = self.summary_tokens
+        start = len(self.messages)
+        while start > self.summarized and used + self.token_counts[start - 1] <= max_tokens:
+            start -= 1
+            used += self.token_counts[start]
+
+        while start < len(self.messages) and not isinstance(self.messages[start], HumanMessage):
+            start += 1
+
+        if not self.summary:
+            return self.messages[start:]
+        return [SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}")] + self.messages[start:]
+
+    def window_tokens(self, window: List[BaseMessage]) -> int:
+        """
+        Token count of a window returned by :meth:`window`, from the cached counts.
+        """
+        verbatim = [message for message in window if message.type != "system"]
+        return sum(self.token_counts[len(self.messages) - len(verbatim):]) + (self.summary_tokens if self.summary else 0)
+
+    def unsummarized(self, keep_messages: int) -> List[BaseMessage]:
+        """
+        Conversation messages not yet folded into the summary, excluding the ``keep_messages`` most recent.
+        """
+        end = max(self.summarized, len(self.messages) - keep_messages)
+        return [message for message in self.messages[self.summarized:end] if isinstance(message, (HumanMessage, AIMessage))]
+
+    def fold(self, summary: str, covered: int) -> None:
+        """
+        Replace the summary with one covering the first ``covered`` messages.
+
+        :param summary: New running summary.
+        :param covered: Number of leading messages the summary covers.
+        """
+        self.summary = summary
+        self.summary_tokens = message_tokens(SystemMessage(content=summary))
+        self.summarized = max(self.summarized, covered)
+
+    def __len__(self) -> int:
+        return len(self.messages)
@@ -0,0 +1,110 @@
+"""
+Answer a list of questions in bulk, e.g. to check answers after a content sync.
+
+Questions are read from a text file (one per line) or JSON lines with ``question`` and an optional
+``id``; the labelled files of ``scripts.tune_retrieval`` work as they are. Answers are written as
+JSON lines in completion order, the same lines ``POST /chat/batch`` streams:
+
+    python3 -m scripts.batch_questions data/eval-questions.jsonl --output logs/answers.jsonl
+    python3 -m scripts.batch_questions questions.txt --host http://127.0.0.1:8000
+
+Without ``--host`` the agent runs in this process, with the providers selected by ``LLM_PROVIDER``.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()  # noqa: E402
+
+import httpx
+
+from models.index import BATCH_MAX_QUESTIONS, BatchQuestion
+
+parser = argparse.ArgumentParser(description="Answer many stateless questions and write the answers as JSON lines.")
+parser.add_argument("questions", type=str, help="Text file with one question per line, or JSON lines")
+parser.add_argument("--host", type=str, default=None, help="Base URL of a running API; in-process if omitted")
+parser.add_argument("--output", type=str, default=None, help="File for the answers, stdout by default")
+parser.add_argument("--concurrency", type=int, default=None, help="Generations at once in-process (BATCH_CONCURRENCY)")
+parser.add_argument("--timeout", type=float, default=600.0, help="Timeout per API batch, seconds")
+
+
+def load_questions(path: str) -> list[BatchQuestion]:
+    questions = []
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                questions.append(BatchQuestion(question=record["question"], id=record.get("id")))
+            else:
+                questions.append(BatchQuestion(question=line))
+    return questions
+
+
+async def answer_remote(host: str, questions: list[BatchQuestion], timeout: float):
+    """
+    Stream answers from ``POST /chat/batch``, in requests of at most ``BATCH_MAX_QUESTIONS`` questions.
+    """
+    async with httpx.AsyncClient(base_url=host, timeout=timeout) as client:
+        for start in range(0, len(questions), BATCH_MAX_QUESTIONS):
+            payload = {"questions": [item.model_dump() for item in questions[start:start + BATCH_MAX_QUESTIONS]]}
+            async with client.stream("POST", "/chat/batch", json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        result = json.loads(line)
+                        result["index"] += start
+                        yield result
+
+
+async def answer_local(questions: list[BatchQuestion], concurrency: int = None):
+    """
+    Answer with an in-process agent.
+    """
+    from main import create_agent
+
+    llm = create_agent()
+    try:
+        options = {"concurrency": concurrency} if concurrency else {}
+        async for result in llm.answer_batch([item.question for item in questions], **options):
+            item = questions[result["index"]]
+            yield {"id": item.id, "question": item.question, **result}
+    finally:
+        await llm.aclose()
+
+
+async def run(args):
+    questions = load_questions(args.questions)
+    results = answer_remote(args.host, questions, args.timeout) if args.host \
+        else answer_local(questions, args.concurrency)
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    started = time.perf_counter()
+    counts = {}
+    try:
+        async for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            outcome = result.get("source", "error")
+            counts[outcome] = counts.get(outcome, 0) + 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    summary = ", ".join(f"{count} {outcome}" for outcome, count in sorted(counts.items()))
+    print(f"Answered {sum(counts.values())}/{len(questions)} questions in {elapsed:.1f}s ({summary})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parser.parse_args()))
+    except (OSError, ValueError, httpx.HTTPError) as ex:
+        print(str(ex), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,97 @@
+import argparse
+import os
+import pathlib
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()  # noqa: E402
+
+from langchain_core.documents.base import Document
+from langchain_text_splitters import MarkdownHeaderTextSplitter
+
+from utils.chunking import HEADERS, count_tokens, split_text
+from utils.docstore import SQLiteDocStore
+from utils.index import load_documents
+from utils.stats import summarize
+
+root = pathlib.Path(__file__).parent.parent.resolve()
+DB_PATH = f"{root}/data/docs.sqlite"
+
+parser = argparse.ArgumentParser(description="Benchmark the chunking engine on the data/ corpus.")
+parser.add_argument("--path", type=str, default=None,
+                    help="Directory of local .md files to benchmark instead of data/docs.sqlite")
+parser.add_argument("--multiply", type=int, default=1,
+                    help="Replicate the corpus N times to simulate a larger one")
+parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                    help="Worker processes for the parallel run")
+parser.add_argument("--repeat", type=int, default=3,
+                    help="Number of timed runs per mode")
+
+
+def load_corpus(path: str = None) -> list[Document]:
+    """
+    Load the benchmark corpus from a local directory or from the scraped documents store.
+    """
+    if path:
+        return load_documents(path, extension='.md')
+    return SQLiteDocStore(db_path=DB_PATH).allList()
+
+
+def header_only_split(documents: list[Document]) -> list[Document]:
+    """
+    Previous behaviour: split on Markdown headers only, without a size cap, exact duplicates dropped.
+    """
+    md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS, strip_headers=False)
+    chunks = {}
+    for doc in documents:
+        for chunk in md_splitter.split_text(doc.page_content):
+            chunks.setdefault(chunk.page_content, chunk)
+    return list(chunks.values())
+
+
+def timed(fn, repeat: int) -> tuple[float, list]:
+    """
+    Run ``fn`` ``repeat`` times and return the best wall time together with the last result.
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def print_sizes(title: str, chunks: list[Document]):
+    sizes = summarize([count_tokens(chunk.page_content) for chunk in chunks])
+    print(f"{title:<22} chunks={sizes['count']:<7} tokens mean={sizes['mean']:.0f} "
+          f"p95={sizes['p95']:.0f} max={sizes['max']:.0f}")
+
+
+def run(args):
+    documents = load_corpus(args.path)
+    if not documents:
+        print("Corpus is empty, run the scrapper first or pass --path")
+        return
+
+    documents = [Document(page_content=doc.page_content, metadata={"source": f"{doc.metadata.get('source')}#{copy}"})
+                 for copy in range(args.multiply) for doc in documents]
+    total_tokens = sum(count_tokens(doc.page_content) for doc in documents)
+    print(f"Corpus: {len(documents)} documents, ~{total_tokens} tokens")
+
+    header_time, header_chunks = timed(lambda: header_only_split(documents), args.repeat)
+    serial_time, serial_chunks = timed(lambda: split_text(documents, max_workers=1), args.repeat)
+    parallel_time, parallel_chunks = timed(lambda: split_text(documents, max_workers=args.workers), args.repeat)
+
+    print()
+    print_sizes("header-only (old)", header_chunks)
+    print_sizes("size-bounded", serial_chunks)
+    print()
+    print(f"header-only (old)      {header_time:.3f}s")
+    print(f"serial                 {serial_time:.3f}s  {total_tokens / serial_time:,.0f} tokens/s")
+    print(f"parallel ({args.workers} workers)   {parallel_time:.3f}s  {total_tokens / parallel_time:,.0f} tokens/s")
+    assert [c.id for c in serial_chunks] == [c.id for c in parallel_chunks], "parallel output differs from serial"
+
+
+if __name__ == "__main__":
+    run(parser.parse_args())
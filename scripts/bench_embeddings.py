@@ -0,0 +1,91 @@
+"""
+Throughput benchmark for micro-batched embedding queries.
+
+Concurrent callers embed single queries through :class:`providers.embeddings.OllamaBatchEmbeddings`
+against a simulated Ollama ``/api/embed`` (``httpx.MockTransport``) that serves one request at a
+time, taking a fixed overhead plus a per-text cost, as a single GPU does. The same load runs once
+with batching disabled (``max_batch=1``) and once enabled:
+
+    python3 -m scripts.bench_embeddings --callers 32 --queries 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from providers.embeddings import OllamaBatchEmbeddings
+from utils.stats import summarize
+
+parser = argparse.ArgumentParser(description="Compare embedding throughput with and without micro-batching.")
+parser.add_argument("--callers", type=int, default=32, help="Concurrent callers, e.g. chats in flight")
+parser.add_argument("--queries", type=int, default=20, help="Queries per caller")
+parser.add_argument("--request-latency", type=float, default=0.015, help="Server overhead per request, seconds")
+parser.add_argument("--text-latency", type=float, default=0.002, help="Server cost per embedded text, seconds")
+parser.add_argument("--max-batch", type=int, default=32, help="Batch size limit of the batched run")
+parser.add_argument("--max-wait-ms", type=float, default=5, help="Gathering window of the batched run")
+parser.add_argument("--dimensions", type=int, default=1024, help="Embedding size returned by the mock server")
+
+
+def mock_ollama(args) -> tuple[httpx.MockTransport, list]:
+    """
+    Build a transport answering ``/api/embed`` like a single-slot Ollama server.
+
+    :return: Transport and the list collecting the size of every request it served.
+    """
+    lock = asyncio.Lock()
+    batch_sizes = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        texts = json.loads(request.content)["input"]
+        async with lock:
+            await asyncio.sleep(args.request_latency + args.text_latency * len(texts))
+        batch_sizes.append(len(texts))
+        return httpx.Response(200, json={"model": "mock", "embeddings": [[0.1] * args.dimensions for _ in texts]})
+
+    return httpx.MockTransport(handler), batch_sizes
+
+
+async def run_load(embeddings: OllamaBatchEmbeddings, args) -> tuple[float, list]:
+    latencies = []
+
+    async def caller(idx: int):
+        rng = random.Random(idx)
+        for query in range(args.queries):
+            await asyncio.sleep(rng.uniform(0, 0.002))
+            started = time.perf_counter()
+            await embeddings.aembed_query(f"question {idx}-{query}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[caller(idx) for idx in range(args.callers)])
+    return time.perf_counter() - started, latencies
+
+
+async def run(args):
+    total = args.callers * args.queries
+    print(f"{args.callers} callers x {args.queries} queries, server {args.request_latency * 1000:.0f} ms/request "
+          f"+ {args.text_latency * 1000:.1f} ms/text\n")
+    print(f"{'mode':<10}{'queries/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'requests':>10}{'mean batch':>12}")
+
+    results = {}
+    for mode, max_batch in (("single", 1), ("batched", args.max_batch)):
+        transport, batch_sizes = mock_ollama(args)
+        embeddings = OllamaBatchEmbeddings(base_url="http://ollama", max_batch=max_batch,
+                                           max_wait_ms=args.max_wait_ms if max_batch > 1 else 0,
+                                           transport=transport)
+        wall, latencies = await run_load(embeddings, args)
+        await embeddings.aclose()
+
+        latency = summarize(latencies)
+        results[mode] = total / wall
+        print(f"{mode:<10}{total / wall:>12.1f}{latency['p50'] * 1000:>10.1f}{latency['p95'] * 1000:>10.1f}"
+              f"{len(batch_sizes):>10}{sum(batch_sizes) / len(batch_sizes):>12.1f}")
+
+    print(f"\nThroughput gain: {results['batched'] / results['single']:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parser.parse_args()))
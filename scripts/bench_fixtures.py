@@ -0,0 +1,82 @@
+import random
+
+from langchain_chroma.vectorstores import Chroma
+from langchain_core.documents.base import Document
+from langchain_core.embeddings import Embeddings
+
+from providers.fake import FakeEmbeddings
+from utils.chroma import open_chunks
+from utils.chunking import split_text
+
+TOPICS = ["custom software development", "cloud migration", "data engineering", "machine learning",
+          "mobile applications", "quality assurance", "devops automation", "ui and ux design",
+          "ad tech platforms", "video streaming", "healthcare solutions", "fintech products",
+          "e-commerce platforms", "dedicated teams", "legacy modernization", "cybersecurity audits",
+          "it consulting", "product discovery", "support and maintenance", "staff augmentation"]
+WORDS = ["client", "project", "team", "delivery", "architecture", "scalable", "platform", "experience",
+         "engineers", "requirements", "release", "integration", "performance", "analytics", "roadmap",
+         "security", "budget", "timeline", "stakeholders", "workflow", "automation", "quality", "support"]
+FOOTER = "Contact us today to discuss your project. Our team will get back to you within one business day."
+FIXTURE_BATCH_SIZE = 256
+
+
+def fixture_documents(documents: int = 200, seed: int = 7) -> list[Document]:
+    """
+    Generate a deterministic corpus of company pages in Markdown.
+
+    Pages cover :data:`TOPICS`, mix short and long sections and share a boilerplate footer, like
+    scraped pages do.
+
+    :param documents: Number of pages.
+    :param seed: Random seed.
+    :return: List of documents with a ``source`` metadata field.
+    """
+    rng = random.Random(seed)
+    docs = []
+    for idx in range(documents):
+        topic = TOPICS[idx % len(TOPICS)]
+        sections = [f"# {topic.title()} #{idx}\n\nWe provide {topic} services for growing companies."]
+        for section in range(rng.randint(2, 5)):
+            paragraphs = []
+            for _ in range(rng.randint(1, 6)):
+                words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80)))
+                paragraphs.append(f"Our {topic} {words}.")
+            sections.append(f"## {topic.title()} part {section}\n\n" + "\n\n".join(paragraphs))
+        sections.append(FOOTER)
+        docs.append(Document(page_content="\n\n".join(sections), metadata={"source": f"https://fixture.local/{idx}"}))
+
+    return docs
+
+
+def fixture_questions(count: int, seed: int = 11) -> list[str]:
+    """
+    Generate deterministic questions about the fixture corpus.
+
+    :param count: Number of questions.
+    :param seed: Random seed.
+    :return: List of questions.
+    """
+    rng = random.Random(seed)
+    templates = ["What {topic} services do you offer?",
+                 "How does your team handle {topic}?",
+                 "Can you tell me more about {topic} and the {word}?",
+                 "Do you have experience with {topic} for a {word}?"]
+    return [rng.choice(templates).format(topic=rng.choice(TOPICS), word=rng.choice(WORDS)) for _ in range(count)]
+
+
+def build_fixture_corpus(path: str, documents: int = 200, embeddings: Embeddings = None) -> int:
+    """
+    Chunk the fixture corpus and store it in a Chroma database.
+
+    :param path: Chroma persist directory; should be empty.
+    :param documents: Number of pages to generate.
+    :param embeddings: Embedding function, :class:`FakeEmbeddings` by default.
+    :return: Number of stored chunks.
+    """
+    chunks = split_text(fixture_documents(documents), max_workers=1)
+    db = open_chunks(path, embeddings or FakeEmbeddings())
+    for start in range(0, len(chunks), FIXTURE_BATCH_SIZE):
+        batch = chunks[start:start + FIXTURE_BATCH_SIZE]
+        db.add_documents(batch, ids=[chunk.id for chunk in batch])
+
+    return len(chunks)
@@ -0,0 +1,257 @@
+"""
+Offline latency/throughput benchmark for the RAG pipeline.
+
+Runs ``AIAgent.query`` against a fixture Chroma corpus with deterministic fake LLM and embedding
+providers, so it needs neither LM Studio nor Ollama. Reports p50/p95/p99 latency, throughput and
+peak memory per pipeline stage, prompt tokens and the share of each prompt reusable from the
+inference server's prefix cache, and saves the results as JSON; compare two result files to spot
+regressions between commits:
+
+    python3 -m scripts.bench_rag
+    python3 -m scripts.bench_rag --compare logs/bench/rag-<old>.json logs/bench/rag-<new>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()  # noqa: E402
+
+from models.index import ChatMessage
+from providers.fake import FakeEmbeddings, FakeProvider
+from providers.rag_agent import AIAgent
+from scripts.bench_fixtures import build_fixture_corpus, fixture_questions
+from utils.index import write_json_atomic
+from utils.prompt_stats import PromptStats
+from utils.stats import summarize
+from utils.timing import add_stage_listener, remove_stage_listener, start_timings
+
+root = pathlib.Path(__file__).parent.parent.resolve()
+RESULTS_PATH = f"{root}/logs/bench"
+SCENARIOS = ("single", "multi", "concurrent")
+
+parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark for the RAG pipeline.")
+parser.add_argument("--scenarios", type=str, default=",".join(SCENARIOS),
+                    help="Comma-separated scenarios to run: single, multi, concurrent")
+parser.add_argument("--documents", type=int, default=200, help="Fixture corpus size in pages")
+parser.add_argument("--requests", type=int, default=50, help="Questions in the single-turn scenario")
+parser.add_argument("--sessions", type=int, default=10, help="Sessions in the multi-turn and concurrent scenarios")
+parser.add_argument("--turns", type=int, default=4, help="Turns per session")
+parser.add_argument("--concurrency", type=int, default=8, help="Sessions running at once in the concurrent scenario")
+parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM latency per call, seconds")
+parser.add_argument("--llm-latency-per-token", type=float, default=0.00005,
+                    help="Fake LLM latency per prompt token, seconds")
+parser.add_argument("--embed-latency", type=float, default=0.005, help="Fake embedding latency per call, seconds")
+parser.add_argument("--output", type=str, default=RESULTS_PATH, help="Directory for the JSON results")
+parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), default=None,
+                    help="Compare two result files instead of running the benchmark")
+
+
+class StageRecorder:
+    """
+    Stage listener collecting durations and peak traced memory per stage.
+
+    Peak memory is only attributed per stage in sequential scenarios; with concurrent requests the
+    stages overlap, so only the scenario-wide peak is meaningful. Stages may nest: every stage start
+    resets the tracemalloc peak, so the peak reached so far is first carried into the enclosing stages.
+    """
+    def __init__(self, track_stage_memory: bool):
+        self.durations = {}
+        self.peaks = {}
+        self.__track_stage_memory = track_stage_memory
+        # Open stages as [name, traced memory at start, highest traced memory seen]
+        self.__open = []
+
+    def __carry_peak(self) -> int:
+        peak = tracemalloc.get_traced_memory()[1]
+        for frame in self.__open:
+            frame[2] = max(frame[2], peak)
+        return peak
+
+    def on_stage_start(self, name: str) -> None:
+        if self.__track_stage_memory:
+            self.__carry_peak()
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            self.__open.append([name, current, current])
+
+    def on_stage_end(self, name: str, elapsed: float) -> None:
+        self.durations.setdefault(name, []).append(elapsed)
+        if self.__track_stage_memory and self.__open and self.__open[-1][0] == name:
+            self.__carry_peak()
+            _, baseline, peak = self.__open.pop()
+            self.peaks[name] = max(self.peaks.get(name, 0), peak - baseline)
+
+
+async def timed_query(llm: AIAgent, question: str, session_id: str, latencies: list):
+    start_timings()
+    started = time.perf_counter()
+    await llm.query(ChatMessage(question=question), session_id)
+    latencies.append(time.perf_counter() - started)
+
+
+async def run_session(llm: AIAgent, questions: list[str], latencies: list):
+    session_id = str(uuid.uuid4())
+    for question in questions:
+        await timed_query(llm, question, session_id, latencies)
+
+
+async def run_scenario(name: str, llm: AIAgent, args) -> dict:
+    """
+    Run one scenario and summarize its latencies, throughput, memory and prompt sizes.
+    """
+    questions = fixture_questions(max(args.requests, args.sessions * args.turns))
+    sessions = [questions[idx * args.turns:(idx + 1) * args.turns] for idx in range(args.sessions)]
+    recorder = StageRecorder(track_stage_memory=name != "concurrent")
+    latencies = []
+    prompt_stats = llm.prompt_stats
+    prompt_before = (prompt_stats.prompt_tokens, prompt_stats.prefix_tokens)
+    decisions_before = dict(llm.rewrite_policy.decisions)
+    saved_before = llm.rewrite_policy.seconds_saved
+
+    tracemalloc.start()
+    add_stage_listener(recorder)
+    started = time.perf_counter()
+    try:
+        if name == "single":
+            for question in questions[:args.requests]:
+                await timed_query(llm, question, str(uuid.uuid4()), latencies)
+        elif name == "multi":
+            for session in sessions:
+                await run_session(llm, session, latencies)
+        else:
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def bounded(session):
+                async with semaphore:
+                    await run_session(llm, session, latencies)
+
+            await asyncio.gather(*[bounded(session) for session in sessions])
+    finally:
+        wall = time.perf_counter() - started
+        remove_stage_listener(recorder)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    prompt_tokens = prompt_stats.prompt_tokens - prompt_before[0]
+    prefix_tokens = prompt_stats.prefix_tokens - prompt_before[1]
+    stages = {}
+    for stage_name, durations in recorder.durations.items():
+        stages[stage_name] = summarize(durations)
+        if stage_name in recorder.peaks:
+            stages[stage_name]["peak_memory_kb"] = recorder.peaks[stage_name] / 1024
+
+    return {
+        "requests": len(latencies),
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "latency": summarize(latencies),
+        "stages": stages,
+        "peak_memory_kb": peak / 1024,
+        "rewrite": {
+            "decisions": {decision: count - decisions_before.get(decision, 0)
+                          for decision, count in llm.rewrite_policy.decisions.items()},
+            "seconds_saved": llm.rewrite_policy.seconds_saved - saved_before,
+        },
+        "prompt": {
+            "mean_tokens": prompt_tokens / len(latencies) if latencies else 0.0,
+            "prefix_ratio": prefix_tokens / prompt_tokens if prompt_tokens else 0.0,
+        },
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=root, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_scenario(name: str, result: dict):
+    latency = result["latency"]
+    print(f"\n[{name}] {result['requests']} requests in {result['wall_seconds']:.2f}s, "
+          f"{result['throughput_rps']:.1f} req/s, peak memory {result['peak_memory_kb']:.0f} KiB")
+    if "prompt" in result:
+        print(f"  prompt {result['prompt']['mean_tokens']:.0f} tokens on average, "
+              f"{result['prompt']['prefix_ratio'] * 100:.0f}% reusable prefix")
+    if "rewrite" in result:
+        decisions = ", ".join(f"{decision} {count}" for decision, count in sorted(result["rewrite"]["decisions"].items()))
+        print(f"  rewrite decisions: {decisions}; ~{result['rewrite']['seconds_saved']:.2f}s saved")
+    print(f"  {'stage':<14}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>10}")
+    rows = [("total", latency)] + sorted(result["stages"].items())
+    for stage_name, summary in rows:
+        peak = f"{summary['peak_memory_kb']:.0f}" if "peak_memory_kb" in summary else "-"
+        print(f"  {stage_name:<14}{summary['p50'] * 1000:>10.1f}{summary['p95'] * 1000:>10.1f}"
+              f"{summary['p99'] * 1000:>10.1f}{peak:>10}")
+
+
+def compare(baseline_path: str, candidate_path: str):
+    """
+    Print p50/p95 and throughput changes between two result files.
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    with open(candidate_path) as file:
+        candidate = json.load(file)
+
+    print(f"{baseline['commit']} -> {candidate['commit']}")
+    for name, result in candidate["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if not base:
+            continue
+        change = (result["throughput_rps"] / base["throughput_rps"] - 1) * 100 if base["throughput_rps"] else 0.0
+        print(f"\n[{name}] throughput {base['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s ({change:+.1f}%)")
+        rows = [("total", base["latency"], result["latency"])]
+        rows += [(stage_name, base["stages"].get(stage_name), summary) for stage_name, summary in sorted(result["stages"].items())]
+        for stage_name, old, new in rows:
+            if not old:
+                print(f"  {stage_name:<14} new stage, p50 {new['p50'] * 1000:.1f} ms")
+                continue
+            for q in ("p50", "p95"):
+                delta = (new[q] / old[q] - 1) * 100 if old[q] else 0.0
+                print(f"  {stage_name:<14}{q} {old[q] * 1000:>8.1f} -> {new[q] * 1000:>8.1f} ms ({delta:+.1f}%)")
+
+
+async def run(args):
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip() in SCENARIOS]
+
+    with tempfile.TemporaryDirectory() as chroma_path:
+        embeddings = FakeEmbeddings(latency=args.embed_latency)
+        chunks = build_fixture_corpus(chroma_path, documents=args.documents, embeddings=FakeEmbeddings())
+        model = FakeProvider(latency=args.llm_latency, latency_per_token=args.llm_latency_per_token)
+        free_model = FakeProvider(latency=args.llm_latency, latency_per_token=args.llm_latency_per_token)
+        llm = AIAgent(model=model, free_model=free_model, embeddings=embeddings,
+                      persist_directory=chroma_path, persist_dialogs=False, prompt_stats=PromptStats())
+
+        results = {
+            "commit": git_commit(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "config": {key: value for key, value in vars(args).items() if key != "compare"},
+            "corpus_chunks": chunks,
+            "scenarios": {},
+        }
+        for name in scenarios:
+            results["scenarios"][name] = await run_scenario(name, llm, args)
+            print_scenario(name, results["scenarios"][name])
+
+    os.makedirs(args.output, exist_ok=True)
+    output_path = f"{args.output}/rag-{results['commit']}-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    write_json_atomic(output_path, results)
+    print(f"\nResults saved to {output_path}")
+
+
+if __name__ == "__main__":
+    arguments = parser.parse_args()
+    if arguments.compare:
+        compare(*arguments.compare)
+    else:
+        asyncio.run(run(arguments))
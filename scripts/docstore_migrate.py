@@ -0,0 +1,43 @@
+import os
+import pathlib
+import sqlite3
+from datetime import datetime
+
+from utils.docstore import SQLiteDocStore
+
+root = pathlib.Path(__file__).parent.parent.resolve()
+DB_PATH = f"{root}/data/docs.sqlite"
+
+
+def migrate():
+    """
+    Migrate an existing docs.sqlite to compressed, deduplicated text storage.
+
+    - Moves inline page text of legacy rows into the ``blobs`` table (done by ``SQLiteDocStore`` on open)
+    - Runs VACUUM so the freed pages are returned to the file system
+    - Prints file size and payload statistics before and after
+    :return:
+    """
+    if not os.path.exists(DB_PATH):
+        print(f"Nothing to migrate, '{DB_PATH}' does not exist")
+        return
+
+    size_before = os.path.getsize(DB_PATH)
+    db_conn = SQLiteDocStore(db_path=DB_PATH)
+    stats = db_conn.stats()
+    db_conn.conn.close()
+
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("VACUUM")
+    conn.close()
+
+    size_after = os.path.getsize(DB_PATH)
+    print(f"Documents: {stats['documents']}, distinct texts: {stats['blobs']}")
+    print(f"Text payload: {stats['raw_bytes']} bytes raw, {stats['stored_bytes']} bytes stored")
+    print(f"File size: {size_before} -> {size_after} bytes")
+
+
+if __name__ == "__main__":
+    print(f'{str(datetime.today())}')
+    migrate()
+    print('\r\n\r\n')
@@ -1,131 +1,168 @@
-import hashlib
+import argparse
 import os
-import shutil
 import pathlib
 from dotenv import load_dotenv
 
 load_dotenv()  # noqa: E402
 
-from langchain.text_splitter import MarkdownHeaderTextSplitter
 from langchain.schema import Document
 from langchain_chroma.vectorstores import Chroma
 from langchain_ollama import OllamaEmbeddings
 
+from utils.chroma import chunk_ids_by_source, delete_by_sources, delete_sources, hnsw_metadata, open_chunks
+from utils.chunking import split_text
 from utils.docstore import SQLiteDocStore
+from utils.faq import index_faq, open_faq
+from utils.index_versions import activate, building, discard_version
+from utils.loader import DocumentLoader
+from utils.metrics import report_job_timings
+from utils.timing import stage, start_timings
 
 # Path to the directory to save a Chroma database
 root = pathlib.Path(__file__).parent.parent.resolve()
 CHROMA_PATH = f"{root}/{os.environ.get('CHROMA_DIR')}"
 DB_PATH = f"{root}/data/docs.sqlite"
+LOCAL_MANIFEST_PATH = f"{root}/data/local-manifest.json"
+LOCAL_BATCH_SIZE = 32
 
-global_unique_hashes = set()
+parser = argparse.ArgumentParser(description="Build the vector database from scraped or local documents.")
+parser.add_argument("--local", type=str, default=None,
+                    help="Incrementally ingest new and changed .txt/.md/.docx files from this directory")
 
 
-def hash_text(text):
+def save_faq(index_path: str, docs: list[Document]):
     """
-    Generates a SHA-256 hash for the given input text.
-
-    This function takes a string input, encodes it to bytes, computes its SHA-256
-    hash using the hashlib library, and returns the resulting hash value in
-    hexadecimal format. It can be used for applications that require hashing
-    features like integrity validation, password storage, or data comparison.
-
-    :param text: The input string to be hashed.
-    :type text: str
-    :return: The hexadecimal representation of the computed SHA-256 hash.
-    :rtype: str
+    Store the Query/Answer pairs of the documents in the FAQ collection used by the answer fast path.
+    :param index_path: Chroma directory of the index version being built
+    :param docs: Loaded documents
+    :return:
     """
-    hash_object = hashlib.sha256(text.encode())
-    return hash_object.hexdigest()
-
+    with stage("faq"):
+        entries = index_faq(open_faq(index_path, OllamaEmbeddings(model="mxbai-embed-large")), docs)
+    print(f"Saved {entries} FAQ entries.")
 
-def split_text(documents: list[Document]):
-    """
-    Split the text content of the given list into smaller chunks.
-    Args:
-    documents (list[Document]): List of Document objects containing text content to split.
-    Returns:
-    list[Document]: List of Document objects representing the split text chunks.
-    """
-    # Initialize text splitter with specified parameters
-    """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=300,  # Size of each chunk in characters
-        chunk_overlap=100,  # Overlap between consecutive chunks
-        length_function=len,  # Function to compute the length of the text
-        add_start_index=True,  # Flag to add start index to each chunk
-    )
-    text_splitter = MarkdownTextSplitter(
-        chunk_size=500,  # Size of each chunk in characters
-        chunk_overlap=100,  # Overlap between consecutive chunks
-        length_function=len,  # Function to compute the length of the text
-    )
 
-    """
-    headers = [("#", "Header 1"),
-               ("##", "Header 2"),
-               ("###", "Header 3")]
-    md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers, strip_headers=False)
-
-    chunks = []
-    for doc in documents:
-        parsed_chunks = md_splitter.split_text(doc.page_content)
-        for chunk in parsed_chunks:
-            chunk.metadata['source'] = doc.metadata['source']
-        chunks.extend(parsed_chunks)
-
-    # Split documents into smaller chunks using text splitter
-    # chunks = text_splitter.split_documents(documents)
-    print(f"Split {len(documents)} documents into {len(chunks)} chunks.")
-
-    # Deduplication mechanism
-    unique_chunks = []
-    for chunk in chunks:
-        chunk_hash = hash_text(chunk.page_content)
-        if chunk_hash not in global_unique_hashes:
-            unique_chunks.append(chunk)
-            global_unique_hashes.add(chunk_hash)
-
-    print(f"Unique chunks equals {len(unique_chunks)}.")
-    return unique_chunks  # Return the list of split text chunks
-
-
-def save_to_chroma(chunks: list[Document]):
+def save_to_chroma(index_path: str, chunks: list[Document]):
     """
     Save the given list of Document objects to a Chroma database.
     Args:
+    index_path (str): Empty Chroma directory of the index version being built.
     chunks (list[Document]): List of Document objects representing text chunks to save.
     Returns:
     None
     """
-    # Clear out the existing database directory if it exists
-    if os.path.exists(CHROMA_PATH):
-        shutil.rmtree(CHROMA_PATH)
-
     # Create a new Chroma database from the documents using OpenAI embeddings
-    Chroma.from_documents(
-        documents=chunks,
-        embedding=OllamaEmbeddings(model="mxbai-embed-large"),
-        persist_directory=CHROMA_PATH
-    )
+    with stage("embed_store"):
+        Chroma.from_documents(
+            documents=chunks,
+            ids=[chunk.id for chunk in chunks],
+            embedding=OllamaEmbeddings(model="mxbai-embed-large"),
+            persist_directory=index_path,
+            collection_metadata=hnsw_metadata()
+        )
 
-    print(f"Saved {len(chunks)} chunks to {CHROMA_PATH}.")
+    print(f"Saved {len(chunks)} chunks to {index_path}.")
 
 
 def generate_data_store():
     """
     Function to generate vector database in chroma from documents.
+
+    The index is built as a new version next to the live one and only activated once complete, so
+    the API keeps answering from the previous version meanwhile.
     """
     try:
         db_conn = SQLiteDocStore(db_path=DB_PATH)
-        docs_list = db_conn.list()
-        chunks = split_text(docs_list)   # Split documents into manageable chunks
-        save_to_chroma(chunks)  # Save the processed data to a data store
+        with stage("load"):
+            docs_list = db_conn.list()
+        with stage("split"):
+            chunks = split_text(docs_list)   # Split documents into manageable chunks
+        with building(CHROMA_PATH) as (version, index_path):
+            save_to_chroma(index_path, chunks)  # Save the processed data to a data store
+            save_faq(index_path, docs_list)
+            activate(CHROMA_PATH, version)
+        db_conn.replace_chunk_ids({doc.metadata.get('source'): [] for doc in docs_list} | chunk_ids_by_source(chunks),
+                                  replace_all=True)
         db_conn.update_parsed_status([doc.metadata.get('id') for doc in docs_list])
 
     except BaseException as ex:
         print(str(ex))
 
 
+def index_local_batch(db: Chroma, faq_db: Chroma, docs: list[Document], db_conn: SQLiteDocStore) -> dict:
+    """
+    Replace the vectors and FAQ entries of a batch of local documents.
+    :param db: Chroma instance
+    :param faq_db: FAQ collection
+    :param docs: Loaded documents of new or changed files
+    :param db_conn: Document store with the chunk ids of the active index
+    :return: Source -> ids of its new chunks
+    """
+    sources = [doc.metadata.get('source') for doc in docs]
+    with stage("delete"):
+        delete_sources(db, sources, db_conn.chunk_ids(sources))
+    with stage("split"):
+        chunks = split_text(docs)
+    if chunks:
+        with stage("embed_store"):
+            db.add_documents(chunks, ids=[chunk.id for chunk in chunks])
+    with stage("faq"):
+        index_faq(faq_db, docs)
+    return {source: [] for source in sources} | chunk_ids_by_source(chunks)
+
+
+def ingest_local(path: str):
+    """
+    Incrementally ingest a local corpus into a copy of the active index and activate the copy.
+
+    - Extract new and changed files in parallel (unchanged files are skipped via the manifest)
+    - Replace their vectors and FAQ entries in batches as they are extracted
+    - Remove vectors of files deleted since the previous run
+    - Activate the updated copy, then record its chunk ids and progress in the manifest
+    :param path: Corpus directory
+    :return:
+    """
+    with building(CHROMA_PATH, copy_current=True) as (version, index_path):
+        embeddings = OllamaEmbeddings(model="mxbai-embed-large")
+        db = open_chunks(index_path, embeddings)
+        faq_db = open_faq(index_path, embeddings)
+        db_conn = SQLiteDocStore(db_path=DB_PATH)
+        loader = DocumentLoader(path, manifest_path=LOCAL_MANIFEST_PATH)
+
+        total, batch, chunk_ids = 0, [], {}
+        for doc in loader.load():
+            batch.append(doc)
+            if len(batch) >= LOCAL_BATCH_SIZE:
+                chunk_ids |= index_local_batch(db, faq_db, batch, db_conn)
+                total, batch = total + len(batch), []
+
+        if batch:
+            chunk_ids |= index_local_batch(db, faq_db, batch, db_conn)
+            total += len(batch)
+
+        removed = loader.removed_sources()
+        if removed:
+            with stage("delete"):
+                delete_sources(db, removed, db_conn.chunk_ids(removed))
+                delete_by_sources(faq_db, removed)
+
+        if total or removed:
+            activate(CHROMA_PATH, version)
+            db_conn.replace_chunk_ids(chunk_ids, removed_sources=removed)
+        else:
+            discard_version(CHROMA_PATH, version)
+    loader.commit(forget_removed=True)
+
+    print(f"Ingested {total} new or changed documents, removed {len(removed)} from {path}.")
+
+
 if __name__ == "__main__":
-    generate_data_store()
+    args = parser.parse_args()
+    timings = start_timings()
+    try:
+        if args.local:
+            ingest_local(args.local)
+        else:
+            generate_data_store()
+    finally:
+        report_job_timings("ingest", timings)
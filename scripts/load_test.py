@@ -0,0 +1,165 @@
+"""
+Load-test harness replaying logged conversations against the HTTP API.
+
+Parses the ``dialogs/*.md`` logs written by ``store_dialogs`` into sessions and replays every
+session's user turns against ``POST /chat/{chat_id}`` with think time between turns. Sessions run
+either with a fixed concurrency (closed model) or start at a fixed arrival rate (open model).
+Reports latency percentiles, error rates and throughput.
+
+Run it against a local instance backed by stand-in providers to size hardware without a GPU:
+
+    LLM_PROVIDER=fake fastapi run
+    python3 -m scripts.load_test --host http://127.0.0.1:8000 --concurrency 20 --sessions 200
+"""
+import argparse
+import asyncio
+import pathlib
+import random
+import re
+import time
+import uuid
+from glob import glob
+
+import httpx
+
+from utils.stats import summarize
+
+root = pathlib.Path(__file__).parent.parent.resolve()
+DIALOGS_PATH = f"{root}/dialogs"
+
+DIALOG_BLOCK_RE = re.compile(r"```dialog\n(.*?)```", re.DOTALL)
+TURN_RE = re.compile(r"### USER\n(.*?)### ASSISTANT\n(.*?)(?=### USER\n|\Z)", re.DOTALL)
+
+parser = argparse.ArgumentParser(description="Replay logged dialogs against the chat API and report latency.")
+parser.add_argument("--host", type=str, default="http://127.0.0.1:8000", help="Base URL of the API")
+parser.add_argument("--dialogs", type=str, default=DIALOGS_PATH, help="Directory with dialog logs")
+parser.add_argument("--sessions", type=int, default=100, help="Sessions to replay; logs are reused in a cycle")
+parser.add_argument("--concurrency", type=int, default=10, help="Sessions running at once (closed model)")
+parser.add_argument("--arrival-rate", type=float, default=0.0,
+                    help="New sessions per second (open model); overrides --concurrency when set")
+parser.add_argument("--think-scale", type=float, default=1.0,
+                    help="Multiplier for think time between turns; 0 disables it")
+parser.add_argument("--max-think", type=float, default=30.0, help="Upper bound for a single think time, seconds")
+parser.add_argument("--timeout", type=float, default=120.0, help="Request timeout, seconds")
+parser.add_argument("--seed", type=int, default=1, help="Random seed for think times and arrivals")
+
+# Reading and typing speeds used to derive think time from the logged turn lengths
+READ_CHARS_PER_SECOND = 25.0
+TYPE_CHARS_PER_SECOND = 5.0
+
+
+def parse_dialog(content: str) -> list[tuple[str, str]]:
+    """
+    Extract (question, answer) turns from a dialog log.
+
+    Anything outside the ```dialog blocks, such as a generated header, is ignored.
+
+    :param content: Log file content.
+    :return: List of turns in order.
+    """
+    turns = []
+    for block in DIALOG_BLOCK_RE.findall(content):
+        for question, answer in TURN_RE.findall(block):
+            if question.strip():
+                turns.append((question.strip(), answer.strip()))
+    return turns
+
+
+def load_sessions(path: str) -> list[list[tuple[str, str]]]:
+    """
+    Parse every dialog log in a directory into a session.
+
+    :param path: Directory with ``*.md`` logs.
+    :return: Non-empty sessions sorted by file name.
+    """
+    sessions = []
+    for file_path in sorted(glob(f"{path}/*.md")):
+        with open(file_path, "r") as file:
+            turns = parse_dialog(file.read())
+        if turns:
+            sessions.append(turns)
+    return sessions
+
+
+def think_time(rng: random.Random, previous_answer: str, question: str, scale: float, limit: float) -> float:
+    """
+    Time a visitor spends reading the previous answer and typing the next question, with +-50% jitter.
+    """
+    if scale <= 0:
+        return 0.0
+    base = len(previous_answer) / READ_CHARS_PER_SECOND + len(question) / TYPE_CHARS_PER_SECOND
+    return min(limit, base * scale * rng.uniform(0.5, 1.5))
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+        self.requests = 0
+
+    def record(self, latency: float, error: str = None):
+        self.requests += 1
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+        else:
+            self.latencies.append(latency)
+
+
+async def replay_session(client: httpx.AsyncClient, turns: list[tuple[str, str]], results: Results,
+                         rng: random.Random, args):
+    chat_id = str(uuid.uuid4())
+    previous_answer = ""
+    for question, answer in turns:
+        await asyncio.sleep(think_time(rng, previous_answer, question, args.think_scale, args.max_think))
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"/chat/{chat_id}", json={"question": question})
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+        except httpx.HTTPError as ex:
+            error = type(ex).__name__
+        results.record(time.perf_counter() - started, error)
+        previous_answer = answer
+
+
+async def run(args):
+    sessions = load_sessions(args.dialogs)
+    if not sessions:
+        print(f"No dialogs found in {args.dialogs}")
+        return
+
+    print(f"Loaded {len(sessions)} sessions, {sum(len(turns) for turns in sessions)} turns")
+    rng = random.Random(args.seed)
+    plan = [sessions[idx % len(sessions)] for idx in range(args.sessions)]
+    results = Results()
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.host, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        if args.arrival_rate > 0:
+            tasks = []
+            for turns in plan:
+                tasks.append(asyncio.create_task(replay_session(client, turns, results, rng, args)))
+                await asyncio.sleep(rng.expovariate(args.arrival_rate))
+            await asyncio.gather(*tasks)
+        else:
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def bounded(turns):
+                async with semaphore:
+                    await replay_session(client, turns, results, rng, args)
+
+            await asyncio.gather(*[bounded(turns) for turns in plan])
+        wall = time.perf_counter() - started
+
+    latency = summarize(results.latencies)
+    failed = sum(results.errors.values())
+    print(f"\n{results.requests} requests in {wall:.1f}s, {results.requests / wall:.2f} req/s")
+    print(f"Latency ms: p50={latency['p50'] * 1000:.0f} p95={latency['p95'] * 1000:.0f} "
+          f"p99={latency['p99'] * 1000:.0f} max={latency['max'] * 1000:.0f}")
+    print(f"Errors: {failed} ({failed / results.requests * 100 if results.requests else 0:.1f}%)")
+    for error, count in sorted(results.errors.items()):
+        print(f"  {error}: {count}")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parser.parse_args()))
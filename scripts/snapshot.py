@@ -0,0 +1,175 @@
+"""
+Export and import portable snapshots of the vector store.
+
+A snapshot is a directory holding, for every collection (chunks and FAQ), the embeddings as a
+float32 ``.npy`` matrix, which can be memory-mapped, and the ids, documents and metadata as JSON
+lines, plus a ``manifest.json`` with the embedding model, dimensions, counts and SHA-256 checksums.
+
+Importing writes the stored vectors into a new index version and activates it, so a fresh node is
+ready without scraping, ingesting or a single embedding call:
+
+    python3 -m scripts.snapshot export snapshots/2026-10-19
+    python3 -m scripts.snapshot import snapshots/2026-10-19
+"""
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()  # noqa: E402
+
+import chromadb
+import numpy as np
+
+from providers.embeddings import EMBED_MODEL
+from utils.chroma import CHUNKS_COLLECTION
+from utils.faq import FAQ_COLLECTION
+from utils.index import write_json_atomic
+from utils.index_versions import activate, active_path, building
+
+root = pathlib.Path(__file__).parent.parent.resolve()
+CHROMA_PATH = f"{root}/{os.environ.get('CHROMA_DIR')}"
+SNAPSHOT_FORMAT = 1
+COLLECTIONS = (CHUNKS_COLLECTION, FAQ_COLLECTION)
+PAGE_SIZE = 5_000
+
+parser = argparse.ArgumentParser(description="Export or import a portable snapshot of the vector store.")
+parser.add_argument("command", choices=("export", "import"))
+parser.add_argument("path", type=str, help="Snapshot directory")
+parser.add_argument("--force", action="store_true",
+                    help="Import even if the snapshot was embedded with a different model than EMBED_MODEL")
+
+
+def file_sha256(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def export_collection(collection, path: str) -> dict:
+    """
+    Write one collection page by page, so memory stays bounded by ``PAGE_SIZE`` records.
+
+    :return: Manifest entry of the collection.
+    """
+    count = collection.count()
+    vectors = None
+    with open(f"{path}/{collection.name}.jsonl", "w") as records:
+        for offset in range(0, count, PAGE_SIZE):
+            page = collection.get(limit=PAGE_SIZE, offset=offset, include=["embeddings", "documents", "metadatas"])
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(f"{path}/{collection.name}.npy", mode="w+", dtype=np.float32,
+                                                    shape=(count, embeddings.shape[1]))
+            vectors[offset:offset + len(embeddings)] = embeddings
+            for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                records.write(json.dumps({"id": chunk_id, "document": document, "metadata": metadata},
+                                         ensure_ascii=False) + "\n")
+
+    if vectors is None:
+        np.save(f"{path}/{collection.name}.npy", np.zeros((0, 0), dtype=np.float32))
+    else:
+        vectors.flush()
+        del vectors
+
+    files = [f"{collection.name}.npy", f"{collection.name}.jsonl"]
+    return {
+        "count": count,
+        "metadata": collection.metadata,
+        "files": {name: file_sha256(f"{path}/{name}") for name in files},
+    }
+
+
+def export_snapshot(path: str) -> dict:
+    """
+    Export the collections of the active index version.
+
+    :param path: Snapshot directory, created if missing.
+    :return: Manifest.
+    """
+    os.makedirs(path, exist_ok=True)
+    client = chromadb.PersistentClient(path=active_path(CHROMA_PATH))
+    existing = {collection.name for collection in client.list_collections()}
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "embedding_model": EMBED_MODEL,
+        "collections": {},
+    }
+    for name in COLLECTIONS:
+        if name in existing:
+            manifest["collections"][name] = export_collection(client.get_collection(name), path)
+            print(f"Exported {manifest['collections'][name]['count']} records of '{name}'.")
+
+    dimensions = {np.load(f"{path}/{name}.npy", mmap_mode="r").shape[1] for name in manifest["collections"]}
+    manifest["dimensions"] = max(dimensions, default=0)
+    write_json_atomic(f"{path}/manifest.json", manifest)
+    return manifest
+
+
+def import_snapshot(path: str, force: bool = False) -> str:
+    """
+    Verify a snapshot, load it into a new index version and activate it.
+
+    :param path: Snapshot directory.
+    :param force: Ignore a different embedding model.
+    :return: Activated version name.
+    """
+    with open(f"{path}/manifest.json") as file:
+        manifest = json.load(file)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')}")
+    if manifest["embedding_model"] != EMBED_MODEL and not force:
+        raise ValueError(f"Snapshot was embedded with '{manifest['embedding_model']}', "
+                         f"but EMBED_MODEL is '{EMBED_MODEL}'; use --force to import anyway")
+    for entry in manifest["collections"].values():
+        for name, checksum in entry["files"].items():
+            if file_sha256(f"{path}/{name}") != checksum:
+                raise ValueError(f"Checksum mismatch for {name}")
+
+    with building(CHROMA_PATH) as (version, index_path):
+        client = chromadb.PersistentClient(path=index_path)
+        batch_size = client.get_max_batch_size()
+        for name, entry in manifest["collections"].items():
+            collection = client.create_collection(name, metadata=entry["metadata"])
+            vectors = np.load(f"{path}/{name}.npy", mmap_mode="r")
+            with open(f"{path}/{name}.jsonl") as file:
+                batch, offset = [], 0
+                for line in file:
+                    batch.append(json.loads(line))
+                    if len(batch) >= batch_size:
+                        add_batch(collection, batch, vectors[offset:offset + len(batch)])
+                        offset, batch = offset + len(batch), []
+                if batch:
+                    add_batch(collection, batch, vectors[offset:offset + len(batch)])
+            print(f"Imported {entry['count']} records of '{name}'.")
+
+        activate(CHROMA_PATH, version)
+    return version
+
+
+def add_batch(collection, records: list[dict], vectors: np.ndarray):
+    collection.add(ids=[record["id"] for record in records],
+                   embeddings=np.ascontiguousarray(vectors),
+                   documents=[record["document"] for record in records],
+                   metadatas=[record["metadata"] for record in records])
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    try:
+        if args.command == "export":
+            export_snapshot(args.path)
+        else:
+            import_snapshot(args.path, force=args.force)
+    except (OSError, ValueError) as ex:
+        print(str(ex))
+        sys.exit(1)
@@ -6,13 +6,17 @@ from datetime import datetime
 
 load_dotenv()  # noqa: E402
 
-from langchain_chroma.vectorstores import Chroma
-from utils.chroma import delete_by_sources
-from utils.index import generate_md5_hash, split_text
+from utils.chroma import chunk_ids_by_source, delete_sources, open_chunks
+from utils.chunking import split_text
+from utils.index import generate_md5_hash
 from utils.docstore import SQLiteDocStore
+from utils.faq import index_faq, open_faq
+from utils.index_versions import activate, building
 from langchain_community.document_loaders import AsyncHtmlLoader
 from langchain_community.document_transformers import MarkdownifyTransformer, BeautifulSoupTransformer
 from langchain_ollama import OllamaEmbeddings
+from utils.metrics import report_job_timings
+from utils.timing import stage, start_timings
 
 # Path to the directory to save a Chroma database
 root = pathlib.Path(__file__).parent.parent.resolve()
@@ -21,10 +25,7 @@ DB_PATH = f"{root}/data/docs.sqlite"
 CHROMA_PATH = f"{root}/{os.environ.get('CHROMA_DIR')}"
 
 db_conn = SQLiteDocStore(db_path=DB_PATH)
-chroma = Chroma(
-    persist_directory=CHROMA_PATH,
-    embedding_function=OllamaEmbeddings(model="mxbai-embed-large")
-)
+embeddings = OllamaEmbeddings(model="mxbai-embed-large")
 
 
 def asyncLoader():
@@ -35,6 +36,7 @@ def asyncLoader():
     - Compare md5 hash
     - If hashes not equal, remove relate vectors
     - Put new vectors
+    Vectors are replaced in a copy of the active index, which is activated once complete.
     :return:
     """
     parsed_docs = db_conn.parsedList()
@@ -45,23 +47,25 @@ def asyncLoader():
     print(f"Found {len(parsed_docs)} parsed documents")
 
     loader = AsyncHtmlLoader([doc.metadata.get('source') for doc in parsed_docs])
-    docs = loader.load()
+    with stage("fetch"):
+        docs = loader.load()
 
     # Transform
     bs_transformer = BeautifulSoupTransformer()
 
-    for doc in docs:
-        doc.page_content = bs_transformer.remove_unwanted_tags(doc.page_content, ['head', 'iframe', 'svg', 'picture', 'noscript', 'link', 'footer',
-                                                                                  'script', 'img', 'style', 'button'])
-        doc.page_content = bs_transformer.remove_unwanted_classnames(doc.page_content,
-                                                                     ['blog-rec', 'cta-post', 'main-nav', 'search-panel', 'social-panel',
-                                                                      'widget-block', 'modal-layer', 'cmplz-cookiebanner', 'breadcrumbs',
-                                                                      'page-form__content', 'post-date'])
+    with stage("transform"):
+        for doc in docs:
+            doc.page_content = bs_transformer.remove_unwanted_tags(doc.page_content, ['head', 'iframe', 'svg', 'picture', 'noscript', 'link', 'footer',
+                                                                                      'script', 'img', 'style', 'button'])
+            doc.page_content = bs_transformer.remove_unwanted_classnames(doc.page_content,
+                                                                         ['blog-rec', 'cta-post', 'main-nav', 'search-panel', 'social-panel',
+                                                                          'widget-block', 'modal-layer', 'cmplz-cookiebanner', 'breadcrumbs',
+                                                                          'page-form__content', 'post-date'])
 
-        doc.page_content = bs_transformer.remove_unnecessary_lines(doc.page_content)
+            doc.page_content = bs_transformer.remove_unnecessary_lines(doc.page_content)
 
-    md = MarkdownifyTransformer()
-    docs_transformed = md.transform_documents(docs)
+        md = MarkdownifyTransformer()
+        docs_transformed = md.transform_documents(docs)
 
     # Compare md5 hash
     docs2update = []
@@ -87,14 +91,25 @@ def asyncLoader():
 
     print(f'Found {len(docs2update)} documents to be replaced')
 
-    # remove obsolete vectors
-    page_sources = [doc.metadata.get('source') for doc in docs2update]
-    delete_by_sources(chroma, page_sources)
-
-    # form new vectors
-    vectors = split_text(docs2update)
-    chroma.add_documents(vectors)
-    print(f'{len(vectors)} vectors were added')
+    with building(CHROMA_PATH, copy_current=True) as (version, index_path):
+        chroma = open_chunks(index_path, embeddings)
+        faq = open_faq(index_path, embeddings)
+
+        # remove obsolete vectors
+        page_sources = [doc.metadata.get('source') for doc in docs2update]
+        with stage("delete"):
+            delete_sources(chroma, page_sources, db_conn.chunk_ids(page_sources))
+
+        # form new vectors
+        with stage("split"):
+            vectors = split_text(docs2update)
+        with stage("embed_store"):
+            chroma.add_documents(vectors, ids=[vector.id for vector in vectors])
+        print(f'{len(vectors)} vectors were added')
+        with stage("faq"):
+            print(f'{index_faq(faq, docs2update)} FAQ entries were added')
+        activate(CHROMA_PATH, version)
+    db_conn.replace_chunk_ids({source: [] for source in page_sources} | chunk_ids_by_source(vectors))
 
     # Update md5 for parsed docs
     for doc in docs2update:
@@ -106,5 +121,9 @@ def asyncLoader():
 
 if __name__ == "__main__":
     print(f'{str(datetime.today())}')
-    asyncLoader()
+    timings = start_timings()
+    try:
+        asyncLoader()
+    finally:
+        report_job_timings("source_sync", timings)
     print('\r\n\r\n')
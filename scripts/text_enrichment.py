@@ -24,7 +24,9 @@ import os
 import pathlib
 
 from dotenv import load_dotenv
-from utils.index import load_documents
+from utils.index import generate_md5_hash, read_json, write_json_atomic
+from utils.loader import DocumentLoader
+from utils.throttle import AsyncRateLimiter, retry_with_backoff
 
 from langchain_together import ChatTogether
 from langchain_core.prompts import ChatPromptTemplate
@@ -34,6 +36,12 @@ load_dotenv()
 
 root = pathlib.Path(__file__).parent.parent.resolve()
 DATA_PATH = f"{root}/tmp/source"
+MANIFEST_PATH = f"{DATA_PATH}/.enrichment-manifest.json"
+
+# Parallel requests in flight, provider request budget and retries on rate-limit errors
+CONCURRENCY = int(os.environ.get('ENRICH_CONCURRENCY', 4))
+REQUESTS_PER_MINUTE = float(os.environ.get('ENRICH_REQUESTS_PER_MINUTE', 30))
+MAX_RETRIES = int(os.environ.get('ENRICH_MAX_RETRIES', 5))
 
 
 SYSTEM_PROMPT = """
@@ -68,35 +76,67 @@ model = ChatTogether(model="meta-llama/Llama-4-Maverick-17B-128E-Instruct-FP8",
 # model = ChatTogether(model="deepseek-ai/DeepSeek-R1-Distill-Llama-70B-free", together_api_key=os.getenv("AI_TOGETHER_API_KEY"), temperature=0.1)
 
 
-async def document_transform():
+async def transform_one(doc, template, manifest, limiter, semaphore):
     """
-    Load and transform documents
+    Enrich a single document and record it in the manifest
+    :param doc: Source document
+    :param template: Enrichment prompt template
+    :param manifest: Source path -> {hash, output} map of already enriched documents
+    :param limiter: Shared requests-per-minute limiter
+    :param semaphore: Shared bound on requests in flight
     :return:
     """
-    docs = load_documents(DATA_PATH, extension='md')
+    source = doc.metadata["source"]
+    folder, file_path = os.path.split(source)
+    updated_file_path = f"{DATA_PATH}/{file_path}.md".lower()
+    source_hash = generate_md5_hash(doc.page_content)
 
-    template = ChatPromptTemplate.from_template(template=SYSTEM_PROMPT)
+    entry = manifest.get(source)
+    if entry and entry.get("hash") == source_hash and os.path.exists(entry.get("output", "")):
+        print(f"File {source} is unchanged, skipped")
+        return
+
+    prompt = template.format_messages(markdown_document=doc.page_content)
 
-    for doc in docs:
-        folder, file_path = os.path.split(doc.metadata["source"])
-        updated_file_path = f"{DATA_PATH}/{file_path}.md".lower()
+    async def call():
+        await limiter.acquire()
+        return await model.ainvoke(prompt)
 
-        prompt = template.format_messages(markdown_document=doc.page_content)
+    try:
+        async with semaphore:
+            rewritten_content = await retry_with_backoff(call, max_retries=MAX_RETRIES)
 
-        try:
-            rewritten_content = await model.ainvoke(prompt)
+        with open(updated_file_path, "w") as file:
+            file.write(rewritten_content.content)
+
+        manifest[source] = {"hash": source_hash, "output": updated_file_path}
+        write_json_atomic(MANIFEST_PATH, manifest)
+        print(f"File {updated_file_path} added")
+    except BaseException as ex:
+        print(f"Cannot create a file {updated_file_path}: {str(ex)}")
+
+
+async def document_transform():
+    """
+    Load and transform documents concurrently.
+
+    - At most ENRICH_CONCURRENCY requests are in flight and at most ENRICH_REQUESTS_PER_MINUTE start per minute
+    - Rate-limit errors are retried with exponential backoff
+    - Documents whose source content is unchanged since the last successful run are skipped
+    - Files produced by earlier runs are not enriched again
+    :return:
+    """
+    manifest = read_json(MANIFEST_PATH, default={})
+    outputs = {entry.get("output") for entry in manifest.values()}
+
+    docs = [doc for doc in DocumentLoader(DATA_PATH, extensions=('.md',)).load() if doc.metadata["source"] not in outputs]
+
+    template = ChatPromptTemplate.from_template(template=SYSTEM_PROMPT)
+    limiter = AsyncRateLimiter(REQUESTS_PER_MINUTE)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
 
-            with open(updated_file_path, "w") as file:
-                file.write(rewritten_content.content)
+    await asyncio.gather(*[transform_one(doc, template, manifest, limiter, semaphore) for doc in docs])
 
-            print(f"File {updated_file_path} added")
-        except BaseException as ex:
-            print(f"Cannot create a file {updated_file_path}: {str(ex)}")
-        """
-        finally:
-            # make a delay
-            await asyncio.sleep(30)
-        """
 
 if __name__ == "__main__":
     asyncio.run(document_transform())
@@ -0,0 +1,211 @@
+"""
+Sweep HNSW index settings and k over a labelled question set.
+
+For every combination of distance function, M, construction ef and search ef, the stored chunk
+vectors are copied into a scratch collection (no embedding calls), every question is searched and
+the script reports:
+
+- ``recall@k``: share of a question's relevant sources found in the top k, out of at most k
+- ``ann@k``: share of the top k that is as close as the exact brute-force top k, i.e. what the HNSW
+  approximation loses (ties count as found)
+- query latency percentiles, build time and index size on disk
+
+Questions are JSON lines with the question and the sources that answer it:
+
+    {"question": "Do you build mobile apps?", "sources": ["https://example.com/mobile"]}
+
+    python3 -m scripts.tune_retrieval --questions data/eval-questions.jsonl
+    python3 -m scripts.tune_retrieval --fixture 400 --m 8,16,32 --search-ef 10,50,100
+
+``--fixture`` runs offline on the fixture corpus of ``scripts.bench_rag`` with fake embeddings.
+The chosen settings go into ``HNSW_*`` and ``RETRIEVE_K`` in ``.env``; the search ef applies the next time
+the index is opened, the other HNSW settings from the next full ingest.
+"""
+import argparse
+import itertools
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()  # noqa: E402
+
+import chromadb
+import numpy as np
+
+from providers.fake import FakeEmbeddings
+from scripts.bench_fixtures import TOPICS, build_fixture_corpus, fixture_documents, fixture_questions
+from utils.chroma import CHUNKS_COLLECTION, hnsw_metadata
+from utils.index_versions import active_path
+from utils.stats import summarize
+
+root = pathlib.Path(__file__).parent.parent.resolve()
+CHROMA_PATH = f"{root}/{os.environ.get('CHROMA_DIR')}"
+PAGE_SIZE = 5_000
+
+
+def int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",")]
+
+
+parser = argparse.ArgumentParser(description="Measure recall and latency of HNSW settings over labelled questions.")
+parser.add_argument("--questions", type=str, default=None, help="JSON lines with 'question' and 'sources'")
+parser.add_argument("--fixture", type=int, default=0, metavar="DOCUMENTS",
+                    help="Use a fixture corpus of this many pages and generated questions instead of the index")
+parser.add_argument("--fixture-questions", type=int, default=200, help="Generated questions in fixture mode")
+parser.add_argument("--space", type=lambda value: value.split(","), default=["l2", "cosine"],
+                    help="Distance functions, comma-separated")
+parser.add_argument("--m", type=int_list, default=[8, 16, 32], help="HNSW M values, comma-separated")
+parser.add_argument("--construction-ef", type=int_list, default=[100, 200], help="Construction ef values")
+parser.add_argument("--search-ef", type=int_list, default=[10, 50, 100], help="Search ef values")
+parser.add_argument("--k", type=int_list, default=[3, 5, 10], help="Result counts to score")
+parser.add_argument("--output", type=str, default=None, help="Write all results to this JSON file")
+
+
+def read_collection(collection) -> tuple[list[str], np.ndarray, list[str]]:
+    """
+    Read ids, embeddings and sources of a collection page by page.
+    """
+    ids, vectors, sources = [], [], []
+    for offset in range(0, collection.count(), PAGE_SIZE):
+        page = collection.get(limit=PAGE_SIZE, offset=offset, include=["embeddings", "metadatas"])
+        ids.extend(page["ids"])
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        sources.extend((metadata or {}).get("source") for metadata in page["metadatas"])
+    return ids, np.concatenate(vectors), sources
+
+
+def load_index(questions_path: str) -> tuple:
+    """
+    Load the chunks of the active index and embed the labelled questions with the configured model.
+    """
+    from providers.embeddings import OllamaBatchEmbeddings
+
+    client = chromadb.PersistentClient(path=active_path(CHROMA_PATH))
+    ids, vectors, sources = read_collection(client.get_collection(CHUNKS_COLLECTION))
+    with open(questions_path) as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    queries = OllamaBatchEmbeddings().embed_documents([record["question"] for record in records])
+    return ids, vectors, sources, np.asarray(queries, dtype=np.float32), [set(record["sources"]) for record in records]
+
+
+def load_fixture(documents: int, questions: int) -> tuple:
+    """
+    Build the fixture corpus with fake embeddings; a question is labelled with all pages of its topic.
+    """
+    path = tempfile.mkdtemp(prefix="tune-corpus-")
+    try:
+        embeddings = FakeEmbeddings()
+        build_fixture_corpus(path, documents, embeddings)
+        ids, vectors, sources = read_collection(chromadb.PersistentClient(path=path).get_collection(CHUNKS_COLLECTION))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    pages = fixture_documents(documents)
+    texts = fixture_questions(questions)
+    labels = []
+    for text in texts:
+        topic = next(idx for idx, topic in enumerate(TOPICS) if topic in text)
+        labels.append({page.metadata["source"] for idx, page in enumerate(pages) if idx % len(TOPICS) == topic})
+    return ids, vectors, sources, np.asarray(embeddings.embed_documents(texts), dtype=np.float32), labels
+
+
+def exact_distances(vectors: np.ndarray, queries: np.ndarray, space: str) -> np.ndarray:
+    """
+    Brute-force distances of every query to every chunk under a Chroma distance function.
+    """
+    if space == "cosine":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        distances = -queries @ vectors.T
+    elif space == "ip":
+        distances = -queries @ vectors.T
+    else:
+        distances = (queries ** 2).sum(axis=1, keepdims=True) - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)
+    return distances
+
+
+def dir_size(path: str) -> int:
+    return sum(file.stat().st_size for file in pathlib.Path(path).rglob("*") if file.is_file())
+
+
+def evaluate(config: dict, corpus: tuple, distances: np.ndarray, ks: list[int]) -> dict:
+    """
+    Build a scratch collection with one configuration and score all questions against it.
+    """
+    ids, vectors, sources, queries, labels = corpus
+    path = tempfile.mkdtemp(prefix="tune-index-")
+    try:
+        client = chromadb.PersistentClient(path=path)
+        collection = client.create_collection(CHUNKS_COLLECTION, metadata=hnsw_metadata(**config))
+        batch_size = client.get_max_batch_size()
+        started = time.perf_counter()
+        for start in range(0, len(ids), batch_size):
+            collection.add(ids=ids[start:start + batch_size], embeddings=vectors[start:start + batch_size])
+        build_seconds = time.perf_counter() - started
+
+        row_of = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        latencies, found = [], []
+        for query in queries:
+            started = time.perf_counter()
+            result = collection.query(query_embeddings=[query], n_results=max(ks), include=[])
+            latencies.append(time.perf_counter() - started)
+            found.append([row_of[chunk_id] for chunk_id in result["ids"][0]])
+        size = dir_size(path)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    result = {**config, "build_seconds": build_seconds, "index_mb": size / 2 ** 20,
+              "latency_ms": {key: value * 1000 for key, value in summarize(latencies).items() if key != "count"}}
+    for k in ks:
+        recall = [len({sources[row] for row in rows[:k]} & relevant) / min(len(relevant), k)
+                  for rows, relevant in zip(found, labels) if relevant]
+        kth = np.partition(distances, k - 1, axis=1)[:, k - 1] + 1e-5
+        ann = [sum(distances[idx, row] <= kth[idx] for row in rows[:k]) / k for idx, rows in enumerate(found)]
+        result[f"recall@{k}"] = sum(recall) / len(recall) if recall else 0.0
+        result[f"ann@{k}"] = sum(ann) / len(ann) if ann else 0.0
+    return result
+
+
+def run(args) -> list[dict]:
+    if args.fixture:
+        corpus = load_fixture(args.fixture, args.fixture_questions)
+    elif args.questions:
+        corpus = load_index(args.questions)
+    else:
+        parser.error("pass --questions or --fixture")
+    ids, vectors, _, queries, _ = corpus
+    print(f"{len(ids)} chunks, {vectors.shape[1]} dimensions, {len(queries)} questions\n")
+
+    columns = "".join(f"{f'recall@{k}':>10}{f'ann@{k}':>8}" for k in args.k)
+    print(f"{'space':<8}{'M':>4}{'c_ef':>6}{'s_ef':>6}{'build s':>9}{'MB':>8}{'p50 ms':>8}{'p95 ms':>8}{columns}")
+
+    results = []
+    for space in args.space:
+        distances = exact_distances(vectors, queries, space)
+        for m, construction_ef, search_ef in itertools.product(args.m, args.construction_ef, args.search_ef):
+            result = evaluate({"space": space, "m": m, "construction_ef": construction_ef, "search_ef": search_ef},
+                              corpus, distances, args.k)
+            results.append(result)
+            scores = "".join(f"{result[f'recall@{k}']:>10.3f}{result[f'ann@{k}']:>8.3f}" for k in args.k)
+            print(f"{space:<8}{m:>4}{construction_ef:>6}{search_ef:>6}{result['build_seconds']:>9.2f}"
+                  f"{result['index_mb']:>8.1f}{result['latency_ms']['p50']:>8.2f}{result['latency_ms']['p95']:>8.2f}"
+                  f"{scores}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    try:
+        run(parser.parse_args())
+    except (OSError, ValueError) as ex:
+        print(str(ex))
+        sys.exit(1)
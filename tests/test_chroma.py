@@ -0,0 +1,25 @@
+import chromadb
+
+from chromadb.api.shared_system_client import SharedSystemClient
+
+from providers.fake import FakeEmbeddings
+from scripts.bench_fixtures import build_fixture_corpus
+from utils.chroma import open_chunks, release_client, search_by_vector
+
+
+def test_release_client_drops_the_directory_system(tmp_path):
+    path = str(tmp_path)
+    embeddings = FakeEmbeddings()
+    build_fixture_corpus(path, 5, embeddings)
+    SharedSystemClient.clear_system_cache()
+
+    client = chromadb.PersistentClient(path=path)
+    db = open_chunks(path, embeddings, client=client)
+    assert search_by_vector(db, embeddings.embed_query("mobile apps"), k=2)
+    assert path in SharedSystemClient._identifier_to_system
+
+    release_client(client)
+    assert path not in SharedSystemClient._identifier_to_system
+
+    reopened = open_chunks(path, embeddings, client=chromadb.PersistentClient(path=path))
+    assert search_by_vector(reopened, embeddings.embed_query("mobile apps"), k=2)
@@ -0,0 +1,33 @@
+from langchain_core.documents.base import Document
+
+from utils.chunking import split_text
+
+WORDS = ["hotel", "booking", "india", "delivery", "platform", "services", "about", "mobile", "cloud", "teams"]
+
+
+def page(source: str, sentences: int) -> Document:
+    body = " ".join(f"Sentence {idx} covers {' '.join(WORDS[(idx * 7 + offset) % len(WORDS)] for offset in range(6))}."
+                    for idx in range(sentences))
+    return Document(page_content=f"# {source.title()}\n\n{body}", metadata={"source": source})
+
+
+def test_oversized_sections_split_between_words():
+    docs = [page("hotels", 120), page("travel", 80)]
+    words = {word for doc in docs for word in doc.page_content.split()}
+
+    chunks = split_text(docs, max_tokens=60, overlap_tokens=10, max_workers=1, near_duplicate_threshold=0)
+
+    assert len(chunks) > 4
+    for chunk in chunks:
+        tokens = chunk.page_content.split()
+        assert tokens[0] in words and tokens[-1] in words, chunk.page_content
+        assert chunk.metadata["token_count"] <= 60
+
+
+def test_sentence_breaks_keep_the_period_with_the_sentence():
+    chunks = split_text([page("hotels", 120)], max_tokens=60, overlap_tokens=0, max_workers=1,
+                        near_duplicate_threshold=0)
+
+    sentences = [chunk.page_content for chunk in chunks if not chunk.page_content.startswith("#")]
+    assert sentences and all(text.endswith(".") for text in sentences)
+    assert not any(chunk.page_content.startswith(".") for chunk in chunks)
@@ -0,0 +1,74 @@
+import asyncio
+
+from langchain_core.documents.base import Document
+
+from providers.fake import FakeEmbeddings
+from utils.compression import SentenceCompressor
+
+QUESTION = "What about cloud delivery?"
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.texts = []
+
+    async def aembed_documents(self, texts):
+        self.texts.extend(texts)
+        return await super().aembed_documents(texts)
+
+
+class TopicEmbeddings(FakeEmbeddings):
+    # Sentences about cloud point one way, everything else the other
+    def _embed(self, text):
+        return [1.0, 0.0] if "cloud" in text.lower() else [0.0, 1.0]
+
+
+def chunk(topic: str, sentences: int) -> tuple[Document, float]:
+    text = " ".join(f"The {topic} sentence number {idx} talks about {topic} delivery." for idx in range(sentences))
+    return Document(page_content=text, metadata={"source": topic}, id=topic), 1.0
+
+
+def test_concurrent_compress_with_evicting_cache():
+    # Every call misses the tiny cache, so calls evict each other's cached sentences while awaiting the embedding
+    embeddings = FakeEmbeddings(latency=0.01)
+    compressor = SentenceCompressor(embeddings, budget=20, cache_size=4)
+    contexts = [[chunk(topic, 6)] for topic in ("cloud", "mobile", "cloud", "data", "mobile", "cloud")]
+    question = embeddings.embed_query(QUESTION)
+
+    async def run():
+        return await asyncio.gather(*[compressor.compress(question, context) for context in contexts])
+
+    for _ in range(3):
+        results = asyncio.run(run())
+        assert all(result and result[0][0].metadata["token_count"] <= 20 for result in results)
+
+
+def test_compress_embeds_only_uncached_sentences():
+    embeddings = CountingEmbeddings()
+    compressor = SentenceCompressor(embeddings, budget=20)
+    context = [chunk("cloud", 6)]
+    question = embeddings.embed_query(QUESTION)
+
+    asyncio.run(compressor.compress(question, context))
+    assert QUESTION not in embeddings.texts
+    assert len(embeddings.texts) == 6
+
+    asyncio.run(compressor.compress(question, context))
+    assert len(embeddings.texts) == 6
+
+
+def test_compress_keeps_markdown_line_breaks():
+    text = ("## Cloud delivery\n\n"
+            "- Mobile apps are built with Flutter.\n"
+            "- Cloud delivery runs on managed Kubernetes.\n"
+            "- Cloud delivery includes monitoring. Billing is monthly. Cloud costs are reported weekly.\n"
+            "- Websites use a headless CMS.")
+    embeddings = TopicEmbeddings()
+    compressor = SentenceCompressor(embeddings, budget=36)
+
+    [(doc, _)] = asyncio.run(compressor.compress(embeddings.embed_query("cloud"), [(Document(page_content=text), 1.0)]))
+
+    assert doc.page_content == ("## Cloud delivery\n\n"
+                                "- Cloud delivery runs on managed Kubernetes.\n"
+                                "- Cloud delivery includes monitoring. Cloud costs are reported weekly.")
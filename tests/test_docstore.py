@@ -0,0 +1,64 @@
+import json
+import sqlite3
+import zlib
+
+from utils.docstore import CODEC_RAW, CODEC_ZLIB, SQLiteDocStore, decode_text, encode_text
+from utils.index import generate_md5_hash
+
+PAGE = "# Services\n\n" + "We build web and mobile applications for retail and travel companies. " * 40
+
+
+def legacy_database(path: str, rows: list) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE docs (id TEXT PRIMARY KEY, text TEXT, metadata TEXT, hash TEXT(32), "
+                 "parsed BOOLEAN DEFAULT 0)")
+    conn.executemany("INSERT INTO docs (id, text, metadata, hash, parsed) VALUES (?, ?, ?, ?, 0)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_encode_text_round_trip():
+    assert encode_text(PAGE)[0] == CODEC_ZLIB
+    assert encode_text("Hi")[0] == CODEC_RAW
+    for text in (PAGE, "Hi", ""):
+        assert decode_text(*encode_text(text)) == text
+
+
+def test_migrate_moves_legacy_text_into_compressed_blobs(tmp_path):
+    path = str(tmp_path / "docs.sqlite")
+    legacy_database(path, [("a", PAGE, json.dumps({"source": "a"}), generate_md5_hash(PAGE)),
+                           ("b", PAGE, json.dumps({"source": "b"}), None),
+                           ("c", "Short", json.dumps({"source": "c"}), None)])
+
+    store = SQLiteDocStore(path)
+
+    rows = store.conn.execute("SELECT id, text, hash FROM docs ORDER BY id").fetchall()
+    assert [text for _, text, _ in rows] == [None, None, None]
+    assert rows[0][2] == rows[1][2] == generate_md5_hash(PAGE)
+    blobs = dict((doc_hash, (codec, data)) for doc_hash, codec, data in store.conn.execute("SELECT * FROM blobs"))
+    assert len(blobs) == 2
+    codec, data = blobs[generate_md5_hash(PAGE)]
+    assert codec == CODEC_ZLIB and zlib.decompress(data).decode() == PAGE
+    assert store.search("a").page_content == store.search("b").page_content == PAGE
+    assert store.search("c").page_content == "Short"
+    assert store.migrate() == 0
+
+
+def test_migrate_picks_up_rows_written_inline(tmp_path):
+    store = SQLiteDocStore(str(tmp_path / "docs.sqlite"))
+    store.conn.execute("INSERT INTO docs (id, text, metadata, hash, parsed) VALUES ('x', ?, '{}', NULL, 1)", (PAGE,))
+
+    assert store.migrate() == 1
+    assert store.search("x").page_content == PAGE
+    assert store.stats() == {"documents": 1, "blobs": 1, "stored_bytes": len(encode_text(PAGE)[1]),
+                             "raw_bytes": len(PAGE.encode())}
+
+
+def test_sources_without_chunks_stay_recorded(tmp_path):
+    store = SQLiteDocStore(str(tmp_path / "docs.sqlite"))
+    store.replace_chunk_ids({"a": ["a1", "a2"], "empty": []})
+
+    assert store.chunk_ids(["a", "empty", "unknown"]) == {"a": ["a1", "a2"], "empty": []}
+
+    store.replace_chunk_ids({"empty": ["e1"]}, removed_sources=["a"])
+    assert store.chunk_ids(["a", "empty"]) == {"empty": ["e1"]}
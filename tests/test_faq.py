@@ -0,0 +1,58 @@
+from langchain_core.documents.base import Document
+
+from providers.fake import FakeEmbeddings
+from utils.faq import extract_faq_pairs, faq_documents, index_faq, match_faq, open_faq
+
+PAGE = """# Mobile development
+
+We build native and cross-platform apps.
+
+## Query/Answer
+
+**Query 1:** Do you build mobile apps?
+**Answer:** Yes, we build iOS and Android apps
+with Flutter and Kotlin.
+
+- Q: How long does a project take?
+- A: Usually three to six months.
+
+Question 3: Who owns the code?
+
+## Contact
+
+Q: Not part of the FAQ?
+A: Ignored.
+"""
+
+
+def test_extract_faq_pairs_reads_only_the_answered_questions_of_the_section():
+    assert extract_faq_pairs(PAGE) == [
+        ("Do you build mobile apps?", "Yes, we build iOS and Android apps with Flutter and Kotlin."),
+        ("How long does a project take?", "Usually three to six months."),
+    ]
+    assert extract_faq_pairs("# Services\n\nQ: Loose question?\nA: Not in a Q&A section.") == []
+
+
+def test_faq_documents_deduplicate_per_source():
+    docs = [Document(page_content=PAGE, metadata={"source": "mobile"}),
+            Document(page_content=PAGE, metadata={"source": "mobile"}),
+            Document(page_content=PAGE, metadata={"source": "apps"})]
+
+    entries = faq_documents(docs)
+
+    assert len(entries) == 4
+    assert {entry.metadata["source"] for entry in entries} == {"mobile", "apps"}
+
+
+def test_match_faq_applies_the_threshold(tmp_path):
+    embeddings = FakeEmbeddings()
+    db = open_faq(str(tmp_path), embeddings)
+    assert index_faq(db, [Document(page_content=PAGE, metadata={"source": "mobile"})]) == 2
+
+    hit = match_faq(db, embeddings.embed_query("Do you build mobile apps?"), threshold=0.92)
+    assert hit is not None
+    assert hit[0].metadata["answer"].startswith("Yes, we build")
+    assert hit[1] > 0.99
+
+    assert match_faq(db, embeddings.embed_query("What does cloud hosting cost per month?"), threshold=0.92) is None
+    assert match_faq(db, embeddings.embed_query("Do you build mobile apps?"), threshold=1.01) is None
@@ -0,0 +1,48 @@
+import numpy as np
+
+from langchain_core.documents.base import Document
+
+from utils.near_dedup import MinHasher, lsh_params, remove_near_duplicates, shingles
+
+WORDS = [f"word{chr(97 + idx % 26)}{chr(97 + idx // 26)}" for idx in range(400)]
+
+
+def text(start: int, length: int) -> str:
+    return " ".join(WORDS[start:start + length])
+
+
+def jaccard(first: str, second: str) -> float:
+    a, b = set(shingles(first).tolist()), set(shingles(second).tolist())
+    return len(a & b) / len(a | b)
+
+
+def test_minhash_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    base = text(0, 200)
+    for other in (text(20, 200), text(60, 200), text(120, 200)):
+        estimate = (hasher.signature(shingles(base)) == hasher.signature(shingles(other))).mean()
+        assert abs(estimate - jaccard(base, other)) < 0.1
+
+
+def test_shingles_mask_digits_and_case():
+    assert np.array_equal(shingles("Updated on 2024-01-05 by the Team of five"),
+                          shingles("updated on 2025-11-30 by the team of five"))
+
+
+def test_lsh_params_split_the_signature_around_the_threshold():
+    bands, rows = lsh_params(0.9)
+    assert bands * rows == 128
+    assert abs((1 / bands) ** (1 / rows) - 0.9) < 0.05
+
+
+def test_remove_near_duplicates_keeps_first_of_each_group():
+    original = text(0, 200)
+    chunks = [Document(page_content=original, id="first"),
+              Document(page_content=text(200, 200), id="other"),
+              Document(page_content=original.replace(WORDS[100], "changed"), id="near"),
+              Document(page_content=text(100, 200), id="overlap")]
+
+    kept = remove_near_duplicates(chunks, threshold=0.9)
+
+    assert [chunk.id for chunk in kept] == ["first", "other", "overlap"]
+    assert remove_near_duplicates(chunks, threshold=0) == chunks
@@ -0,0 +1,48 @@
+import pytest
+
+from utils.rewrite_policy import RewritePolicy, is_self_contained
+
+SELF_CONTAINED = "Do you offer maintenance contracts for mobile applications?"
+FOLLOW_UP = "How much does it cost?"
+
+
+@pytest.mark.parametrize("question, expected", [
+    (SELF_CONTAINED, True),
+    (FOLLOW_UP, False),
+    ("And what about cloud hosting for web shops?", False),
+    ("Pricing?", False),
+])
+def test_is_self_contained(question, expected):
+    assert is_self_contained(question, min_words=6) is expected
+
+
+def test_is_self_contained_disabled():
+    assert not is_self_contained(SELF_CONTAINED, min_words=0)
+
+
+@pytest.mark.parametrize("has_history, top_score, question, reason", [
+    (False, 0.1, FOLLOW_UP, "no_history"),
+    (True, 0.85, FOLLOW_UP, "high_score"),
+    (True, 0.3, SELF_CONTAINED, "self_contained"),
+    (True, 0.3, FOLLOW_UP, None),
+])
+def test_skip_reason_gates(has_history, top_score, question, reason):
+    policy = RewritePolicy(skip_score=0.8, self_contained_words=6)
+
+    assert policy.skip_reason(has_history, top_score, question) == reason
+    assert policy.decisions == {reason or "rewrite": 1}
+
+
+def test_skipped_rewrites_count_the_mean_latency_saved():
+    policy = RewritePolicy(skip_score=0.8, self_contained_words=6)
+    policy.skip_reason(False, 0.0, FOLLOW_UP)
+    assert policy.seconds_saved == 0.0
+
+    policy.observe(2.0)
+    policy.observe(4.0)
+    assert policy.mean_latency == pytest.approx(2.2)
+
+    policy.skip_reason(True, 0.9, FOLLOW_UP)
+    policy.skip_reason(True, 0.3, FOLLOW_UP)
+    assert policy.seconds_saved == pytest.approx(2.2)
+    assert policy.decisions == {"no_history": 1, "high_score": 1, "rewrite": 1}
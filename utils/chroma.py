@@ -1,13 +1,207 @@
+import logging
+import os
+
+from typing import Optional
+
+import chromadb
+import numpy as np
+
+from chromadb.db.system import SysDB
+from chromadb.types import SegmentScope
 from langchain_chroma.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Collection langchain's Chroma wrapper uses unless told otherwise
+CHUNKS_COLLECTION = "langchain"
+
+# HNSW settings; scripts/tune_retrieval.py helps choose them. The distance function, M and construction ef
+# are fixed when a collection is created, so they apply from the next full ingest. Search ef is applied to
+# existing collections whenever they are opened; it should cover the largest k, MMR candidates included.
+HNSW_SPACE = os.environ.get('HNSW_SPACE', 'l2')
+HNSW_M = int(os.environ.get('HNSW_M', 16))
+HNSW_CONSTRUCTION_EF = int(os.environ.get('HNSW_CONSTRUCTION_EF', 100))
+HNSW_SEARCH_EF = int(os.environ.get('HNSW_SEARCH_EF', 50))
+
+
+def hnsw_metadata(space: str = HNSW_SPACE, m: int = HNSW_M, construction_ef: int = HNSW_CONSTRUCTION_EF,
+                  search_ef: int = HNSW_SEARCH_EF) -> dict:
+    """
+    Collection metadata with HNSW index settings.
+
+    :param space: Distance function: ``l2``, ``cosine`` or ``ip``
+    :param m: Links per node; more improves recall at the cost of memory and build time
+    :param construction_ef: Candidate list size while building
+    :param search_ef: Candidate list size while searching; should be at least the largest k
+    """
+    return {"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef}
+
+
+def open_chunks(persist_directory: str, embeddings: Embeddings, client: Optional[chromadb.ClientAPI] = None) -> Chroma:
+    """
+    Open the chunk collection, creating it with the configured HNSW settings if it does not exist.
+
+    Existing collections keep the distance function, M and construction ef they were built with, and
+    relevance scores follow their distance function; the search ef is updated to ``HNSW_SEARCH_EF``.
+
+    :param client: Client to share with other collections of the same directory, see :func:`release_client`
+    """
+    db = Chroma(persist_directory=persist_directory, embedding_function=embeddings, client=client,
+                collection_metadata=hnsw_metadata())
+    set_search_ef(db)
+    return db
+
+
+def set_search_ef(db: Chroma, search_ef: int = HNSW_SEARCH_EF) -> None:
+    """
+    Set the search ef of an existing collection.
+
+    Chroma 0.5 reads the HNSW parameters from the vector segment, which copies the collection metadata
+    at creation, and ``collection.modify`` neither reaches it nor accepts ``hnsw:space``, which langchain
+    needs for relevance scores. The segment is updated instead; the index uses the new value from the
+    next time it is loaded, so call this before the first query on a new client.
+    """
+    collection = db._collection
+    sysdb = db._client._system.instance(SysDB)
+    for segment in sysdb.get_segments(collection=collection.id, scope=SegmentScope.VECTOR):
+        if (segment["metadata"] or {}).get("hnsw:search_ef") != search_ef:
+            sysdb.update_segment(collection.id, segment["id"], metadata={"hnsw:search_ef": search_ef})
+
+
+def release_client(client: chromadb.ClientAPI) -> None:
+    """
+    Stop the chromadb system behind a persistent client and drop it from chromadb's per-path cache.
+
+    chromadb keeps one system per directory for the life of the process, with the HNSW indexes it
+    loaded, so a long-running reader switching index versions must release the old one. The client
+    and every collection opened through it must not be used afterwards.
+
+    The public ``clear_system_cache()`` stops the systems of all directories, including the one just
+    switched to, so the per-directory entry is dropped instead. That cache is internal to chromadb
+    (pinned in requirements.txt); if it changes, the client is left open with a warning.
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+        systems = SharedSystemClient._identifier_to_system
+        identifier = client._identifier
+    except (ImportError, AttributeError):
+        logger.warning("Cannot release the Chroma client: this chromadb version has no per-directory system cache")
+        return
+
+    system = systems.pop(identifier, None)
+    if system is not None:
+        system.stop()
+
+
+# Bounded delete operations, so large syncs issue several predictable deletes instead of one huge one
+DELETE_BATCH_SIZE = 5_000
+SOURCE_BATCH_SIZE = 100
+
+
+def chunk_ids_by_source(chunks: list[Document]) -> dict[str, list[str]]:
+    """
+    Group chunk ids by their metadata["source"].
+    """
+    grouped = {}
+    for chunk in chunks:
+        grouped.setdefault(chunk.metadata.get("source"), []).append(chunk.id)
+    return grouped
 
 
-def delete_by_sources(db: Chroma, sources: list[str]) -> None:
+def delete_by_ids(db: Chroma, ids: list[str], batch_size: int = DELETE_BATCH_SIZE) -> None:
+    """
+    Delete vectors by id in batches of at most ``batch_size``.
+
+    :param db: Chroma instance
+    :param ids: Chunk ids
+    :param batch_size: Ids per delete call
+    """
+    for start in range(0, len(ids), batch_size):
+        db.delete(ids=ids[start:start + batch_size])
+
+
+def delete_by_sources(db: Chroma, sources: list[str], batch_size: int = SOURCE_BATCH_SIZE) -> None:
     """
     Delete all vectors from Chroma where metadata["source"] == source.
 
+    Filters on metadata, which makes Chroma scan it; prefer :func:`delete_sources` when chunk ids are known.
+
     :param db: Chroma instance
     :param sources: The value of metadata["source"] to filter by
+    :param batch_size: Sources per delete call
+    """
+    for start in range(0, len(sources), batch_size):
+        db.delete(where={"source": {"$in": sources[start:start + batch_size]}})
+    print(f"All vectors of {len(sources)} sources deleted successfully.")
+
+
+def delete_sources(db: Chroma, sources: list[str], known_ids: dict[str, list[str]]) -> None:
+    """
+    Delete the vectors of sources, by id where the chunk ids are known.
+
+    Sources without recorded ids, e.g. indexed before ids were recorded, fall back to the metadata filter.
+
+    :param db: Chroma instance
+    :param sources: Sources to delete
+    :param known_ids: Source -> chunk ids, see ``SQLiteDocStore.chunk_ids``
+    """
+    delete_by_ids(db, [chunk_id for source in sources for chunk_id in known_ids.get(source, [])])
+    unknown = [source for source in sources if source not in known_ids]
+    if unknown:
+        delete_by_sources(db, unknown)
+
+
+def search_by_vector(db: Chroma, embedding: list[float], k: int) -> list[tuple[Document, float]]:
+    """
+    Search by a precomputed query embedding and return relevance scores.
+
+    Same scores as ``similarity_search_with_relevance_scores``, but the embedding call is left to the
+    caller so it can be timed, batched or reused.
+
+    :param db: Chroma instance
+    :param embedding: Query embedding
+    :param k: Number of results
+    :return: List of (Document, relevance score) tuples, most relevant first
+    """
+    relevance_score_fn = db._select_relevance_score_fn()
+    return [(doc, relevance_score_fn(distance))
+            for doc, distance in db.similarity_search_by_vector_with_relevance_scores(embedding, k=k)]
+
+
+def search_with_embeddings(db: Chroma, embedding: list[float], k: int) -> list[tuple[Document, float, np.ndarray]]:
+    """
+    Like :func:`search_by_vector`, but also return the stored embedding of every chunk.
+
+    The embeddings come back from the same HNSW query, so post-processing such as MMR needs no
+    extra lookup or embedding call.
+
+    :param db: Chroma instance
+    :param embedding: Query embedding
+    :param k: Number of results
+    :return: List of (Document, relevance score, embedding) tuples, most relevant first
+    """
+    return search_batch_with_embeddings(db, [embedding], k)[0]
+
+
+def search_batch_with_embeddings(db: Chroma, embeddings: list[list[float]], k: int
+                                 ) -> list[list[tuple[Document, float, np.ndarray]]]:
+    """
+    Run :func:`search_with_embeddings` for many query embeddings in a single Chroma query.
+
+    :param db: Chroma instance
+    :param embeddings: Query embeddings
+    :param k: Number of results per query
+    :return: One result list per query embedding, in the same order
     """
-    collection = db._collection  # low-level chromadb API
-    collection.delete(where={"source": {"$in": sources}})
-    print(f"All vectors with source $in '{sources}' deleted successfully.")
+    if not embeddings:
+        return []
+    relevance_score_fn = db._select_relevance_score_fn()
+    results = db._collection.query(query_embeddings=embeddings, n_results=k,
+                                   include=["documents", "metadatas", "distances", "embeddings"])
+    return [[(Document(page_content=content, metadata=metadata or {}, id=chunk_id),
+              relevance_score_fn(distance), np.asarray(vector, dtype=np.float32))
+             for content, metadata, chunk_id, distance, vector in zip(*columns)]
+            for columns in zip(results["documents"], results["metadatas"], results["ids"], results["distances"],
+                               results["embeddings"])]
@@ -0,0 +1,138 @@
+import hashlib
+import math
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional
+
+from langchain_core.documents.base import Document
+from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+
+from utils.index import hash_text
+from utils.near_dedup import NEAR_DUP_THRESHOLD, remove_near_duplicates
+
+CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', 400))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS', 50))
+# Below this number of documents the process pool start-up costs more than it saves
+PARALLEL_MIN_DOCUMENTS = int(os.environ.get('CHUNK_PARALLEL_MIN_DOCUMENTS', 64))
+
+CHARS_PER_TOKEN = 4.0
+HEADERS = [("#", "Header 1"),
+           ("##", "Header 2"),
+           ("###", "Header 3")]
+# Regexes, split in this order; the sentence break keeps its period with the sentence it ends
+SEPARATORS = [r"\n#{1,6} ", r"\n\n", r"\n", r"(?<=\.) ", r" ", r""]
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate the number of tokens in a text.
+
+    Uses the same characters-per-token estimate as langchain's ``count_tokens_approximately``, so the
+    counts are deterministic, need no tokenizer download and match the agent's history trimming.
+
+    :param text: Text to measure.
+    :return: Approximate token count.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def chunk_id(source: str, content: str) -> str:
+    """
+    Build a deterministic chunk id from the chunk source and content.
+
+    Re-ingesting unchanged content yields the same id, so vectors can be upserted and deleted by id.
+
+    :param source: Source of the parent document.
+    :param content: Chunk text.
+    :return: Hex id string.
+    """
+    return hashlib.sha256(f"{source}\x00{content}".encode()).hexdigest()[:32]
+
+
+@lru_cache(maxsize=8)
+def _get_splitters(max_tokens: int, overlap_tokens: int):
+    """
+    Build (and cache per process) the header splitter and the size-bounded splitter.
+    """
+    md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=HEADERS, strip_headers=False)
+    size_splitter = RecursiveCharacterTextSplitter(separators=SEPARATORS,
+                                                   is_separator_regex=True,
+                                                   chunk_size=max_tokens,
+                                                   chunk_overlap=overlap_tokens,
+                                                   length_function=count_tokens)
+    return md_splitter, size_splitter
+
+
+def _split_document(doc: Document, max_tokens: int, overlap_tokens: int) -> List[Document]:
+    """
+    Split one document on Markdown headers, then cap every section at ``max_tokens``.
+
+    Each chunk gets ``source``, ``header_path``, ``chunk_index`` and ``token_count`` metadata and a
+    deterministic id.
+    """
+    md_splitter, size_splitter = _get_splitters(max_tokens, overlap_tokens)
+    source = doc.metadata.get('source', '')
+
+    chunks = []
+    for section in md_splitter.split_text(doc.page_content):
+        header_path = " > ".join(section.metadata[name] for _, name in HEADERS if name in section.metadata)
+        if count_tokens(section.page_content) <= max_tokens:
+            parts = [section.page_content]
+        else:
+            parts = size_splitter.split_text(section.page_content)
+
+        for part in parts:
+            metadata = dict(section.metadata)
+            metadata['source'] = source
+            metadata['header_path'] = header_path
+            metadata['chunk_index'] = len(chunks)
+            metadata['token_count'] = count_tokens(part)
+            chunks.append(Document(id=chunk_id(source, part), page_content=part, metadata=metadata))
+
+    return chunks
+
+
+def split_text(documents: list[Document],
+               max_tokens: int = CHUNK_MAX_TOKENS,
+               overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+               max_workers: Optional[int] = None,
+               near_duplicate_threshold: float = NEAR_DUP_THRESHOLD) -> List[Document]:
+    """
+    Split the text content of the given list into header-aware, size-bounded chunks.
+
+    Large corpora are split across a process pool; the output order always follows the input order.
+    Exact duplicate chunks are dropped, then near duplicates (see :func:`remove_near_duplicates`).
+
+    :param documents: List of Document objects containing text content to split.
+    :param max_tokens: Maximum chunk size in tokens.
+    :param overlap_tokens: Overlap between consecutive chunks of an oversized section, in tokens.
+    :param max_workers: Number of worker processes; ``1`` forces serial splitting, ``None`` uses all CPUs.
+    :param near_duplicate_threshold: Jaccard similarity at which chunks count as near duplicates; ``0`` disables it.
+    :return: List of Document objects representing the split text chunks.
+    """
+    workers = max_workers or os.cpu_count() or 1
+    if workers > 1 and len(documents) >= PARALLEL_MIN_DOCUMENTS:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = executor.map(_split_document, documents,
+                                  [max_tokens] * len(documents),
+                                  [overlap_tokens] * len(documents),
+                                  chunksize=max(1, len(documents) // (workers * 4)))
+            chunks = [chunk for doc_chunks in parsed for chunk in doc_chunks]
+    else:
+        chunks = [chunk for doc in documents for chunk in _split_document(doc, max_tokens, overlap_tokens)]
+
+    print(f"Split {len(documents)} documents into {len(chunks)} chunks.")
+
+    # Deduplication mechanism
+    global_unique_hashes = set()
+    unique_chunks = []
+    for chunk in chunks:
+        chunk_hash = hash_text(chunk.page_content)
+        if chunk_hash not in global_unique_hashes:
+            unique_chunks.append(chunk)
+            global_unique_hashes.add(chunk_hash)
+
+    print(f"Unique chunks equals {len(unique_chunks)}.")
+    return remove_near_duplicates(unique_chunks, threshold=near_duplicate_threshold)
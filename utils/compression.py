@@ -0,0 +1,154 @@
+import os
+import re
+
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from langchain_core.documents.base import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.chunking import count_tokens
+from utils.index import hash_text
+
+# Token budget for the compressed context (0 disables compression)
+COMPRESSED_CONTEXT_TOKENS = int(os.environ.get('COMPRESSED_CONTEXT_TOKENS', 600))
+SENTENCE_CACHE_SIZE = int(os.environ.get('SENTENCE_CACHE_SIZE', 20_000))
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[\"“(\[A-Z0-9])")
+MIN_SENTENCE_CHARS = 3
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Find the sentences of a chunk text; every Markdown line (header, list item) starts a new one.
+
+    :param text: Chunk content.
+    :return: (start, end) offsets of the non-empty sentences, without surrounding whitespace, in order.
+    """
+    spans, offset = [], 0
+    for line in text.splitlines(keepends=True):
+        start = 0
+        breaks = [(match.start(), match.end()) for match in SENTENCE_END_RE.finditer(line)]
+        for end, next_start in breaks + [(len(line), len(line))]:
+            piece = line[start:end]
+            left, right = len(piece) - len(piece.lstrip()), len(piece.rstrip())
+            if right - left >= MIN_SENTENCE_CHARS:
+                spans.append((offset + start + left, offset + start + right))
+            start = next_start
+        offset += len(line)
+    return spans
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split chunk text into sentences, see :func:`sentence_spans`.
+
+    :param text: Chunk content.
+    :return: Non-empty sentences in order.
+    """
+    return [text[start:end] for start, end in sentence_spans(text)]
+
+
+def join_sentences(text: str, spans: List[Tuple[int, int]], kept: List[int]) -> str:
+    """
+    Join kept sentences with the whitespace of the text, so list items and headers stay on their own
+    lines: of the whitespace after the previous kept sentence and before the next one, the one with
+    more line breaks.
+
+    :param text: Chunk content.
+    :param spans: Sentence offsets from :func:`sentence_spans`.
+    :param kept: Indexes of the kept sentences, ascending.
+    :return: Compressed content.
+    """
+    parts, previous = [], None
+    for idx in kept:
+        start, end = spans[idx]
+        if previous is not None:
+            after = text[spans[previous][1]:spans[previous + 1][0]]
+            before = text[spans[idx - 1][1]:start]
+            after, before = after[:len(after) - len(after.lstrip())], before[len(before.rstrip()):]
+            parts.append(max(before, after, key=lambda gap: gap.count("\n")) or " ")
+        parts.append(text[start:end])
+        previous = idx
+    return "".join(parts)
+
+
+class SentenceCompressor:
+    """
+    Extractive, non-LLM compression of retrieved chunks.
+
+    Splits the chunks into sentences, embeds them in a single batch and keeps the sentences most similar
+    to the question embedding that fit into the token budget, in their original order and with their
+    original line breaks. Chunks keep their metadata and id; chunks left without sentences are dropped.
+
+    Sentence embeddings are cached, since the same popular chunks are retrieved over and over.
+    """
+    def __init__(self, embeddings: Embeddings, budget: int = COMPRESSED_CONTEXT_TOKENS,
+                 cache_size: int = SENTENCE_CACHE_SIZE):
+        self.__embeddings = embeddings
+        self.budget = budget
+        self.__cache_size = cache_size
+        self.__cache: OrderedDict[str, np.ndarray] = OrderedDict()
+
+    async def __embed(self, sentences: List[str]) -> np.ndarray:
+        """
+        Embed the sentences not cached yet in one batch.
+        """
+        keys = [hash_text(sentence) for sentence in sentences]
+        # Copy cached vectors first: concurrent calls may evict them from the shared cache during the await
+        found = {key: self.__cache[key] for key in keys if key in self.__cache}
+        by_key = dict(zip(keys, sentences))
+        missing = [key for key in by_key if key not in found]
+        vectors = await self.__embeddings.aembed_documents([by_key[key] for key in missing]) if missing else []
+        for key, vector in zip(missing, vectors):
+            found[key] = np.asarray(vector, dtype=np.float32)
+        matrix = np.vstack([found[key] for key in keys])
+
+        for key, vector in found.items():
+            self.__cache[key] = vector
+            self.__cache.move_to_end(key)
+        while len(self.__cache) > self.__cache_size:
+            self.__cache.popitem(last=False)
+        return matrix
+
+    async def compress(self, question_embedding: Sequence[float],
+                       context: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+        """
+        Reduce the chosen chunks to the sentences most relevant to the question.
+
+        :param question_embedding: Embedding of the user question, as used for the search.
+        :param context: Chosen (Document, score) tuples.
+        :return: (Document, score) tuples with compressed content, in the given order.
+        """
+        spans = [sentence_spans(doc.page_content) for doc, _ in context]
+        flat = [(doc_idx, sentence_idx, context[doc_idx][0].page_content[start:end])
+                for doc_idx, doc_spans in enumerate(spans) for sentence_idx, (start, end) in enumerate(doc_spans)]
+        if self.budget <= 0 or not flat or sum(count_tokens(text) for _, _, text in flat) <= self.budget:
+            return context
+
+        vectors = await self.__embed([sentence for _, _, sentence in flat])
+        query = np.asarray(question_embedding, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        similarity = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+
+        keep, used = set(), 0
+        for idx in np.argsort(-similarity):
+            tokens = count_tokens(flat[idx][2])
+            if used + tokens <= self.budget:
+                keep.add(int(idx))
+                used += tokens
+
+        kept = {}
+        for idx in sorted(keep):
+            doc_idx, sentence_idx, _ = flat[idx]
+            kept.setdefault(doc_idx, []).append(sentence_idx)
+
+        compressed = []
+        for doc_idx, (doc, score) in enumerate(context):
+            if doc_idx in kept:
+                content = join_sentences(doc.page_content, spans[doc_idx], kept[doc_idx])
+                metadata = {**doc.metadata, "token_count": count_tokens(content)}
+                compressed.append((Document(page_content=content, metadata=metadata, id=doc.id), score))
+        return compressed
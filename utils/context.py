@@ -0,0 +1,105 @@
+import os
+
+from typing import List, Tuple
+
+import numpy as np
+
+from langchain_core.documents.base import Document
+
+from utils.chunking import count_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1200))
+
+# Trade-off between relevance (1.0) and diversity (0.0) in Maximal Marginal Relevance
+MMR_LAMBDA = float(os.environ.get('MMR_LAMBDA', 0.7))
+MMR_K = int(os.environ.get('MMR_K', 6))
+
+
+def chunk_tokens(doc: Document) -> int:
+    """
+    Token count of a retrieved chunk.
+
+    Uses the ``token_count`` stored in the chunk metadata at ingest time and only counts chunks
+    indexed before it was recorded.
+
+    :param doc: Retrieved chunk.
+    :return: Token count.
+    """
+    token_count = doc.metadata.get('token_count')
+    if isinstance(token_count, int):
+        return token_count
+    return count_tokens(doc.page_content)
+
+
+def dedup_by_id(candidates: List[tuple]) -> List[tuple]:
+    """
+    Merge search results, keeping the best-scoring entry of every chunk.
+
+    Chunks are identified by their id, falling back to their content for chunks stored without one.
+
+    :param candidates: Tuples starting with (Document, score), e.g. from several searches.
+    :return: Unique candidates, most relevant first.
+    """
+    best = {}
+    for candidate in candidates:
+        doc, score = candidate[0], candidate[1]
+        key = doc.id or doc.page_content
+        if key not in best or score > best[key][1]:
+            best[key] = candidate
+    return sorted(best.values(), key=lambda item: item[1], reverse=True)
+
+
+def mmr_select(candidates: List[Tuple[Document, float, np.ndarray]], k: int = MMR_K,
+               lambda_mult: float = MMR_LAMBDA) -> List[Tuple[Document, float]]:
+    """
+    Pick up to ``k`` relevant but mutually different chunks with Maximal Marginal Relevance.
+
+    The relevance term is the search score of each candidate, so results of several queries can be
+    ranked together. Pairwise cosine similarities are computed once as a single matrix product; every
+    step then only updates the running maximum similarity to the chunks already selected.
+
+    :param candidates: Unique (Document, score, embedding) tuples.
+    :param k: Number of chunks to select.
+    :param lambda_mult: Weight of relevance against diversity.
+    :return: Selected (Document, score) tuples in selection order.
+    """
+    if not candidates:
+        return []
+
+    vectors = np.vstack([candidate[2] for candidate in candidates]).astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1.0, norms)
+    similarity = vectors @ vectors.T
+    relevance = np.array([candidate[1] for candidate in candidates], dtype=np.float32)
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[selected] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        np.maximum(max_similarity, similarity[chosen], out=max_similarity)
+
+    return [(candidates[idx][0], candidates[idx][1]) for idx in selected]
+
+
+def pack_context(candidates: List[Tuple[Document, float]], budget: int = CONTEXT_TOKEN_BUDGET) -> List[Tuple[Document, float]]:
+    """
+    Fill a prompt token budget with chunks in order of preference.
+
+    A chunk that does not fit into the remaining budget is skipped so that smaller, lower-ranked chunks
+    can still use the space.
+
+    :param candidates: List of (Document, score) tuples, preferred first (see :func:`mmr_select`).
+    :param budget: Token budget for the context section of the prompt.
+    :return: Selected (Document, score) tuples, in the given order.
+    """
+    packed, used = [], 0
+    for doc, score in candidates:
+        tokens = chunk_tokens(doc)
+        if used + tokens <= budget:
+            packed.append((doc, score))
+            used += tokens
+
+    return packed
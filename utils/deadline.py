@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+from utils.metrics import STAGE_TIMEOUTS
+
+T = TypeVar("T")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """
+    Set an overall deadline for the awaits wrapped in :func:`within` in the current context.
+
+    Deadlines only tighten: a nested deadline later than the current one is ignored.
+
+    :param seconds: Time budget from now, 0 or less for no deadline.
+    """
+    current = _deadline.get()
+    if seconds > 0:
+        expires = time.monotonic() + seconds
+        current = expires if current is None else min(current, expires)
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left until the deadline of the current context, or None without one.
+    """
+    expires = _deadline.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+async def within(awaitable: Awaitable[T], name: str, timeout: float = 0) -> T:
+    """
+    Await a stage, cancelling it after its own timeout or at the request deadline, whichever comes first.
+
+    :param awaitable: Coroutine of the stage.
+    :param name: Stage name, used as the label of ``rag_stage_timeouts_total``.
+    :param timeout: Stage timeout in seconds, 0 for none.
+    :return: Result of the awaitable.
+    :raises asyncio.TimeoutError: If the stage timed out or the deadline passed.
+    """
+    limits = [limit for limit in (timeout if timeout > 0 else None, remaining()) if limit is not None]
+    if not limits:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(min(limits), 0))
+    except asyncio.TimeoutError:
+        STAGE_TIMEOUTS.inc(stage=name)
+        raise
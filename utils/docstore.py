@@ -1,24 +1,72 @@
 import json
 import sqlite3
 import uuid
+import zlib
 
-from typing import List
+from typing import List, Optional
 
 from langchain_community.docstore.base import Docstore
 from langchain.docstore.document import Document
 
 from utils.index import generate_md5_hash
 
+CODEC_RAW = "raw"
+CODEC_ZLIB = "zlib"
+ZLIB_LEVEL = 6
+# Stay below SQLite's default limit of host parameters per statement
+SQL_VARIABLES_LIMIT = 900
+# Chunk id recorded for an indexed source without chunks, so it is not mistaken for an unrecorded one
+NO_CHUNKS = ""
+
+
+def encode_text(text: str) -> tuple[str, bytes]:
+    """
+    Encode page text for storage.
+
+    The text is zlib-compressed; when compression does not make it smaller (very short texts)
+    it is kept as plain UTF-8 bytes instead.
+
+    :param text: Text to encode.
+    :return: Tuple of codec marker and encoded payload.
+    """
+    raw = text.encode("utf-8")
+    compressed = zlib.compress(raw, ZLIB_LEVEL)
+    if len(compressed) < len(raw):
+        return CODEC_ZLIB, compressed
+    return CODEC_RAW, raw
+
+
+def decode_text(codec: str, data: bytes) -> str:
+    """
+    Decode a stored payload back into text.
+
+    :param codec: Codec marker saved with the payload.
+    :param data: Encoded payload.
+    :return: Decoded text.
+    :raises ValueError: If the codec is unknown.
+    """
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    if codec == CODEC_RAW:
+        return bytes(data).decode("utf-8")
+    raise ValueError(f"Unknown text codec '{codec}'")
+
 
 class SQLiteDocStore(Docstore):
     """
     SQLite-backed document store.
 
-    Stores text, JSON metadata, MD5 hash and a parsed flag for each document.
+    Stores JSON metadata, MD5 hash and a parsed flag for each document. Page text is kept
+    in a content-addressed ``blobs`` table keyed by the MD5 hash, compressed, so identical
+    pages are stored only once. Rows written by older versions keep their text inline in
+    ``docs.text`` and are moved to ``blobs`` by :meth:`migrate`.
+
+    The ``chunks`` table maps every source to the ids of its chunks in the active vector index,
+    so vectors can be deleted by id instead of by a metadata filter.
     """
     def __init__(self, db_path="docs.sqlite"):
         """
-        Initialize the store and ensure the table exists.
+        Initialize the store, ensure the tables exist and migrate legacy rows.
 
         :param db_path: Path to the SQLite database file.
         :type db_path: str
@@ -27,6 +75,61 @@ class SQLiteDocStore(Docstore):
         self.conn.execute(
             "CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, text TEXT, metadata TEXT, hash TEXT(32), parsed BOOLEAN DEFAULT 0)"
         )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (hash TEXT(32) PRIMARY KEY, codec TEXT NOT NULL, data BLOB NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS docs_hash_idx ON docs (hash)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (source TEXT NOT NULL, chunk_id TEXT NOT NULL, PRIMARY KEY (source, chunk_id))"
+        )
+        self.conn.commit()
+        self.migrate()
+
+    def migrate(self) -> int:
+        """
+        Move inline text of legacy rows into the compressed ``blobs`` table.
+
+        Rows with a missing hash get it recomputed. Safe to run repeatedly.
+
+        :returns: Number of migrated rows.
+        :rtype: int
+        """
+        rows = self.conn.execute("SELECT id, text, hash FROM docs WHERE text IS NOT NULL").fetchall()
+        if not rows:
+            return 0
+
+        with self.conn:
+            for doc_id, text, doc_hash in rows:
+                doc_hash = doc_hash or generate_md5_hash(text)
+                self._put_text(doc_hash, text)
+                self.conn.execute("UPDATE docs SET text=NULL, hash=? WHERE id=?", (doc_hash, doc_id))
+
+        return len(rows)
+
+    def _put_text(self, doc_hash: str, text: str) -> None:
+        """
+        Store page text under its hash unless an identical text is already stored.
+
+        :param doc_hash: MD5 hash of the text.
+        :param text: Page text.
+        """
+        codec, data = encode_text(text)
+        self.conn.execute("INSERT OR IGNORE INTO blobs (hash, codec, data) VALUES (?, ?, ?)", (doc_hash, codec, data))
+
+    def _collect_garbage(self) -> None:
+        """
+        Remove blobs that are no longer referenced by any document.
+        """
+        self.conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM docs WHERE hash IS NOT NULL)")
+
+    @staticmethod
+    def _row_text(text: Optional[str], codec: Optional[str], data: Optional[bytes]) -> str:
+        """
+        Resolve document text from either the inline legacy column or the blob payload.
+        """
+        if data is not None:
+            return decode_text(codec, data)
+        return text or ""
 
     def update_document(self, doc_id: str, doc: Document):
         """
@@ -41,21 +144,25 @@ class SQLiteDocStore(Docstore):
         :returns: None
         :rtype: None
         """
-        self.conn.execute(
-            """UPDATE docs SET
-            text=?,
-            metadata=?,
-            parsed=1,
-            hash=?
-            WHERE id=?""",
-            (doc.page_content, json.dumps(doc.metadata), generate_md5_hash(doc.page_content), doc_id))
-        self.conn.commit()
+        doc_hash = generate_md5_hash(doc.page_content)
+        with self.conn:
+            self._put_text(doc_hash, doc.page_content)
+            self.conn.execute(
+                """UPDATE docs SET
+                text=NULL,
+                metadata=?,
+                parsed=1,
+                hash=?
+                WHERE id=?""",
+                (json.dumps(doc.metadata), doc_hash, doc_id))
+            self._collect_garbage()
 
     def add(self, doc: Document) -> str:
         """
         Insert a new document.
 
-        Saves text, JSON metadata, computed MD5 hash, and sets ``parsed=0``.
+        Saves JSON metadata, computed MD5 hash, and sets ``parsed=0``. The text is stored once
+        per distinct content.
 
         :param doc: Document to insert.
         :type doc: Document
@@ -63,11 +170,13 @@ class SQLiteDocStore(Docstore):
         :rtype: str
         """
         doc_id = str(uuid.uuid4())
-        self.conn.execute(
-            "INSERT INTO docs VALUES (?, ?, ?, ?, ?)",
-            (doc_id, doc.page_content, json.dumps(doc.metadata), generate_md5_hash(doc.page_content), 0),
-        )
-        self.conn.commit()
+        doc_hash = generate_md5_hash(doc.page_content)
+        with self.conn:
+            self._put_text(doc_hash, doc.page_content)
+            self.conn.execute(
+                "INSERT INTO docs (id, text, metadata, hash, parsed) VALUES (?, NULL, ?, ?, ?)",
+                (doc_id, json.dumps(doc.metadata), doc_hash, 0),
+            )
         return doc_id
 
     def update_parsed_status(self, doc_ids: List[str]):
@@ -93,12 +202,14 @@ class SQLiteDocStore(Docstore):
         :rtype: Document
         :raises KeyError: If the document is not found.
         """
-        cur = self.conn.execute("SELECT text, metadata FROM docs WHERE id=?", (doc_id,))
+        cur = self.conn.execute(
+            "SELECT d.text, b.codec, b.data, d.metadata FROM docs d LEFT JOIN blobs b ON b.hash = d.hash WHERE d.id=?",
+            (doc_id,))
         row = cur.fetchone()
         if row is None:
             raise KeyError(f"Doc {doc_id} not found")
-        text, metadata = row
-        return Document(page_content=text, metadata=json.loads(metadata))
+        text, codec, data, metadata = row
+        return Document(page_content=self._row_text(text, codec, data), metadata=json.loads(metadata))
 
     def list(self) -> List[Document]:
         """
@@ -109,12 +220,13 @@ class SQLiteDocStore(Docstore):
         :returns: Unparsed documents.
         :rtype: List[Document]
         """
-        cur = self.conn.execute("SELECT text, metadata, id FROM docs WHERE parsed=0")
+        cur = self.conn.execute(
+            "SELECT d.text, b.codec, b.data, d.metadata, d.id FROM docs d LEFT JOIN blobs b ON b.hash = d.hash WHERE d.parsed=0")
         docs = []
-        for text, meta, fid in cur.fetchall():
+        for text, codec, data, meta, fid in cur.fetchall():
             metadata = json.loads(meta)
             metadata['id'] = fid
-            docs.append(Document(page_content=text, metadata=metadata))
+            docs.append(Document(page_content=self._row_text(text, codec, data), metadata=metadata))
 
         return docs
 
@@ -127,16 +239,97 @@ class SQLiteDocStore(Docstore):
         :returns: Parsed documents.
         :rtype: List[Document]
         """
-        cur = self.conn.execute("SELECT hash, text, metadata, id FROM docs WHERE parsed=1 limit 1")
+        cur = self.conn.execute(
+            "SELECT d.hash, d.text, b.codec, b.data, d.metadata, d.id FROM docs d LEFT JOIN blobs b ON b.hash = d.hash WHERE d.parsed=1 limit 1")
         docs = []
-        for doc_hash, text, meta, fid in cur.fetchall():
+        for doc_hash, text, codec, data, meta, fid in cur.fetchall():
             metadata = json.loads(meta)
             metadata['id'] = fid
             metadata['hash'] = doc_hash
-            docs.append(Document(page_content=text, metadata=metadata))
+            docs.append(Document(page_content=self._row_text(text, codec, data), metadata=metadata))
+
+        return docs
+
+    def allList(self) -> List[Document]:
+        """
+        List all documents regardless of the ``parsed`` flag.
+
+        Adds ``id`` to each document's metadata.
+
+        :returns: All documents.
+        :rtype: List[Document]
+        """
+        cur = self.conn.execute(
+            "SELECT d.text, b.codec, b.data, d.metadata, d.id FROM docs d LEFT JOIN blobs b ON b.hash = d.hash")
+        docs = []
+        for text, codec, data, meta, fid in cur.fetchall():
+            metadata = json.loads(meta)
+            metadata['id'] = fid
+            docs.append(Document(page_content=self._row_text(text, codec, data), metadata=metadata))
 
         return docs
 
+    def stats(self) -> dict:
+        """
+        Summarize storage usage.
+
+        :returns: Number of documents, distinct stored texts, and stored vs. uncompressed payload bytes.
+        :rtype: dict
+        """
+        documents = self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+        blobs, stored = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs").fetchone()
+        raw = 0
+        for codec, data in self.conn.execute("SELECT codec, data FROM blobs"):
+            raw += len(decode_text(codec, data).encode("utf-8"))
+
+        return {"documents": documents, "blobs": blobs, "stored_bytes": stored, "raw_bytes": raw}
+
+    def chunk_ids(self, sources: List[str]) -> dict:
+        """
+        Look up the chunk ids recorded for sources.
+
+        :param sources: Source URLs or file paths.
+        :type sources: List[str]
+        :returns: Source -> list of chunk ids, only for recorded sources; empty for sources indexed without chunks.
+        :rtype: dict
+        """
+        found = {}
+        for start in range(0, len(sources), SQL_VARIABLES_LIMIT):
+            batch = sources[start:start + SQL_VARIABLES_LIMIT]
+            placeholders = ','.join('?' for _ in batch)
+            cur = self.conn.execute(f"SELECT source, chunk_id FROM chunks WHERE source IN ({placeholders})", tuple(batch))
+            for source, chunk_id in cur.fetchall():
+                ids = found.setdefault(source, [])
+                if chunk_id != NO_CHUNKS:
+                    ids.append(chunk_id)
+        return found
+
+    def replace_chunk_ids(self, chunk_ids: dict, removed_sources: List[str] = (), replace_all: bool = False) -> None:
+        """
+        Record the chunks of indexed sources, replacing what was recorded for them before.
+
+        Call it once the index version holding these chunks is active. Sources with an empty list are
+        recorded with a :data:`NO_CHUNKS` marker, so deleting them later needs no metadata scan.
+
+        :param chunk_ids: Source -> list of chunk ids.
+        :type chunk_ids: dict
+        :param removed_sources: Sources no longer in the index.
+        :type removed_sources: List[str]
+        :param replace_all: Forget all other sources too, after a full rebuild.
+        :type replace_all: bool
+        :returns: None
+        :rtype: None
+        """
+        with self.conn:
+            if replace_all:
+                self.conn.execute("DELETE FROM chunks")
+            else:
+                self.conn.executemany("DELETE FROM chunks WHERE source=?",
+                                      [(source,) for source in list(chunk_ids) + list(removed_sources)])
+            self.conn.executemany("INSERT OR IGNORE INTO chunks (source, chunk_id) VALUES (?, ?)",
+                                  [(source, chunk_id) for source, ids in chunk_ids.items()
+                                   for chunk_id in (ids or [NO_CHUNKS])])
+
     def truncate(self) -> None:
         """
         Delete all documents from the store.
@@ -144,8 +337,10 @@ class SQLiteDocStore(Docstore):
         :returns: None
         :rtype: None
         """
-        self.conn.execute("DELETE FROM docs")
-        self.conn.commit()
+        with self.conn:
+            self.conn.execute("DELETE FROM docs")
+            self.conn.execute("DELETE FROM blobs")
+            self.conn.execute("DELETE FROM chunks")
 
     def delete(self, doc_id: str) -> None:
         """
@@ -156,5 +351,6 @@ class SQLiteDocStore(Docstore):
         :returns: None
         :rtype: None
         """
-        self.conn.execute("DELETE FROM docs WHERE id=?", (doc_id,))
-        self.conn.commit()
+        with self.conn:
+            self.conn.execute("DELETE FROM docs WHERE id=?", (doc_id,))
+            self._collect_garbage()
@@ -0,0 +1,130 @@
+import os
+import re
+
+from typing import List, Optional, Tuple
+
+import chromadb
+
+from langchain_chroma.vectorstores import Chroma
+from langchain_core.documents.base import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.chroma import delete_by_sources, hnsw_metadata, search_by_vector, set_search_ef
+from utils.chunking import chunk_id
+
+FAQ_COLLECTION = "faq"
+# Cosine similarity above which a stored question is taken as the same question
+FAQ_THRESHOLD = float(os.environ.get('FAQ_THRESHOLD', 0.92))
+
+# Heading of the section appended by scripts/text_enrichment.py, e.g. "## Query/Answer" or "## FAQ"
+SECTION_RE = re.compile(r"^#{1,6}\s*.*\b(query\s*/\s*answer|questions?\s*(?:and|&)\s*answers?|q\s*&\s*a|faq)\b.*$",
+                        re.IGNORECASE | re.MULTILINE)
+HEADING_RE = re.compile(r"^#{1,6}\s", re.MULTILINE)
+# "**Query 1:** ...", "- Q: ...", "1. Question: ...", "### Q3. ..."
+QUESTION_RE = re.compile(r"^(?:#{1,6}\s*)?(?:[-*]\s*|\d+[.)]\s*)?\**\s*(?:query|question|q)\s*\d*\s*[:.]\**\s*:?\s*(.+)$",
+                         re.IGNORECASE)
+ANSWER_RE = re.compile(r"^(?:[-*]\s*)?\**\s*(?:answer|a)\s*\d*\s*[:.]\**\s*:?\s*(.*)$", re.IGNORECASE)
+
+
+def _clean(text: str) -> str:
+    return re.sub(r"\s+", " ", text.replace("**", "")).strip()
+
+
+def extract_faq_pairs(text: str) -> List[Tuple[str, str]]:
+    """
+    Extract question/answer pairs from the Query/Answer section of an enriched document.
+
+    Only the section under a "Query/Answer", "Q&A" or "FAQ" heading is read, up to the next heading of
+    the same or a higher level. Multi-line answers are joined.
+
+    :param text: Markdown document.
+    :return: List of (question, answer) tuples in document order.
+    """
+    section = SECTION_RE.search(text)
+    if not section:
+        return []
+
+    level = len(section.group(0)) - len(section.group(0).lstrip("#"))
+    pairs, question, answer = [], None, None
+    for line in text[section.end():].splitlines():
+        stripped = line.strip()
+        if HEADING_RE.match(stripped) and len(stripped) - len(stripped.lstrip("#")) <= level:
+            break
+        question_match = QUESTION_RE.match(stripped)
+        answer_match = ANSWER_RE.match(stripped)
+        if question_match:
+            if question and answer:
+                pairs.append((_clean(question), _clean(" ".join(answer))))
+            question, answer = question_match.group(1), None
+        elif answer_match and question:
+            answer = [answer_match.group(1)]
+        elif stripped and answer is not None:
+            answer.append(stripped)
+
+    if question and answer:
+        pairs.append((_clean(question), _clean(" ".join(answer))))
+    return [(question, answer) for question, answer in pairs if question and answer]
+
+
+def faq_documents(docs: List[Document]) -> List[Document]:
+    """
+    Turn the Query/Answer sections of documents into FAQ entries.
+
+    The question is the embedded content; the answer and the source document travel in the metadata.
+
+    :param docs: Loaded documents.
+    :return: One Document per unique question and source.
+    """
+    entries = {}
+    for doc in docs:
+        source = doc.metadata.get('source', '')
+        for question, answer in extract_faq_pairs(doc.page_content):
+            entry_id = chunk_id(source, question)
+            entries[entry_id] = Document(page_content=question, id=entry_id,
+                                         metadata={"source": source, "answer": answer})
+    return list(entries.values())
+
+
+def open_faq(persist_directory: str, embeddings: Embeddings, client: Optional[chromadb.ClientAPI] = None) -> Chroma:
+    """
+    Open the FAQ collection stored next to the chunk collection. It uses cosine distance, so relevance
+    scores are cosine similarities and ``FAQ_THRESHOLD`` does not depend on the embedding norm.
+
+    :param client: Client shared with the chunk collection, if any.
+    """
+    db = Chroma(collection_name=FAQ_COLLECTION, persist_directory=persist_directory, embedding_function=embeddings,
+                client=client, collection_metadata=hnsw_metadata(space="cosine"))
+    set_search_ef(db)
+    return db
+
+
+def index_faq(db: Chroma, docs: List[Document]) -> int:
+    """
+    Replace the FAQ entries of the given documents' sources.
+
+    :param db: FAQ collection, see :func:`open_faq`.
+    :param docs: Loaded documents.
+    :return: Number of entries stored.
+    """
+    entries = faq_documents(docs)
+    sources = list({doc.metadata.get('source') for doc in docs if doc.metadata.get('source')})
+    if sources:
+        delete_by_sources(db, sources)
+    if entries:
+        db.add_documents(entries, ids=[entry.id for entry in entries])
+    return len(entries)
+
+
+def match_faq(db: Chroma, embedding: List[float], threshold: float = FAQ_THRESHOLD) -> Optional[Tuple[Document, float]]:
+    """
+    Find the stored question closest to a question embedding.
+
+    :param db: FAQ collection.
+    :param embedding: Question embedding.
+    :param threshold: Minimum cosine similarity.
+    :return: (FAQ entry, similarity) if the best match clears the threshold, otherwise None.
+    """
+    found = search_by_vector(db, embedding, k=1)
+    if found and found[0][1] >= threshold:
+        return found[0]
+    return None
@@ -1,3 +1,4 @@
+import json
 import os
 import pathlib
 import hashlib
@@ -8,7 +9,6 @@ from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from langchain_community.document_loaders import TextLoader, Docx2txtLoader
 from langchain_core.documents.base import Document
 from typing import List
-from langchain.text_splitter import MarkdownHeaderTextSplitter
 
 
 root = pathlib.Path(__file__).parent.parent.resolve()
@@ -25,6 +25,36 @@ def generate_md5_hash(input_string: str) -> str:
     return md5_hash_object.hexdigest()
 
 
+def read_json(path: str, default=None):
+    """
+    Read a JSON file, returning ``default`` if it is missing or corrupted.
+
+    :param path: Path to the JSON file.
+    :param default: Value returned when the file cannot be read.
+    :return: Parsed JSON content.
+    """
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def write_json_atomic(path: str, data) -> None:
+    """
+    Write JSON to a temporary file and atomically move it over ``path``.
+
+    Readers never see a half-written file, even if the process is killed mid-write.
+
+    :param path: Destination path.
+    :param data: JSON-serializable data.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
 def get_user_conversation(history: List[BaseMessage]):
     """
     Filter chat conversation, leaving the only query answer section
@@ -205,44 +235,6 @@ def hash_text(text):
     return hash_object.hexdigest()
 
 
-def split_text(documents: list[Document]):
-    """
-    Split the text content of the given list into smaller chunks.
-    Args:
-    documents (list[Document]): List of Document objects containing text content to split.
-    Returns:
-    list[Document]: List of Document objects representing the split text chunks.
-    """
-    global_unique_hashes = set()
-    # Initialize text splitter with specified parameters
-    headers = [("#", "Header 1"),
-               ("##", "Header 2"),
-               ("###", "Header 3")]
-    md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=headers, strip_headers=False)
-
-    chunks = []
-    for doc in documents:
-        parsed_chunks = md_splitter.split_text(doc.page_content)
-        for chunk in parsed_chunks:
-            chunk.metadata['source'] = doc.metadata['source']
-        chunks.extend(parsed_chunks)
-
-    # Split documents into smaller chunks using text splitter
-    # chunks = text_splitter.split_documents(documents)
-    print(f"Split {len(documents)} documents into {len(chunks)} chunks.")
-
-    # Deduplication mechanism
-    unique_chunks = []
-    for chunk in chunks:
-        chunk_hash = hash_text(chunk.page_content)
-        if chunk_hash not in global_unique_hashes:
-            unique_chunks.append(chunk)
-            global_unique_hashes.add(chunk_hash)
-
-    print(f"Unique chunks equals {len(unique_chunks)}.")
-    return unique_chunks  # Return the list of split text chunks
-
-
 PINK = '\033[95m'
 CYAN = '\033[96m'
 YELLOW = '\033[93m'
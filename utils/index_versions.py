@@ -0,0 +1,164 @@
+import os
+import shutil
+import time
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from utils.index import read_json, write_json_atomic
+from utils.timing import stage
+
+# Blue/green layout under CHROMA_PATH:
+#   versions/<version>/   complete Chroma directories (chunk and FAQ collections)
+#   CURRENT.json          pointer to the version the API reads from, replaced atomically, with the
+#                         versions activated before it
+# Without a pointer CHROMA_PATH itself is read, as before versioning.
+VERSIONS_DIR = "versions"
+POINTER_FILE = "CURRENT.json"
+INDEX_KEEP_VERSIONS = int(os.environ.get('INDEX_KEEP_VERSIONS', 2))
+INDEX_CHECK_INTERVAL = float(os.environ.get('INDEX_CHECK_INTERVAL', 2.0))
+
+
+def current_version(base_path: str) -> Optional[str]:
+    """
+    Name of the active version, or None for an unversioned directory.
+    """
+    pointer = read_json(f"{base_path}/{POINTER_FILE}", default={})
+    return pointer.get("version")
+
+
+def version_path(base_path: str, version: str) -> str:
+    return f"{base_path}/{VERSIONS_DIR}/{version}"
+
+
+def active_path(base_path: str) -> str:
+    """
+    Chroma directory the API should read from.
+
+    :param base_path: ``CHROMA_PATH``
+    :return: Directory of the active version, or ``base_path`` itself when nothing was versioned yet.
+    """
+    version = current_version(base_path)
+    return version_path(base_path, version) if version else base_path
+
+
+def new_version(base_path: str, copy_current: bool = False) -> tuple[str, str]:
+    """
+    Create the directory of a new, inactive version.
+
+    :param base_path: ``CHROMA_PATH``
+    :param copy_current: Start from a copy of the active index, for incremental updates.
+    :return: Tuple of the version name and its directory.
+    """
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = version_path(base_path, version)
+    source = active_path(base_path)
+    if copy_current and os.path.isdir(source):
+        with stage("copy_index"):
+            shutil.copytree(source, path, ignore=shutil.ignore_patterns(VERSIONS_DIR, POINTER_FILE, f"{POINTER_FILE}.tmp"))
+    else:
+        os.makedirs(path)
+    return version, path
+
+
+def discard_version(base_path: str, version: str) -> None:
+    """
+    Delete a version that was never activated, e.g. after a failed build.
+    """
+    shutil.rmtree(version_path(base_path, version), ignore_errors=True)
+    print(f"Discarded index version {version}.")
+
+
+@contextmanager
+def building(base_path: str, copy_current: bool = False):
+    """
+    Create a new version with :func:`new_version` and discard it if the build fails.
+
+    :param base_path: ``CHROMA_PATH``
+    :param copy_current: Start from a copy of the active index, for incremental updates.
+    :return: Tuple of the version name and its directory.
+    """
+    version, path = new_version(base_path, copy_current)
+    try:
+        yield version, path
+    except BaseException:
+        if current_version(base_path) != version:
+            discard_version(base_path, version)
+        raise
+
+
+def activate(base_path: str, version: str, keep: int = INDEX_KEEP_VERSIONS) -> None:
+    """
+    Atomically point readers at a version, then remove versions no longer needed.
+
+    The pointer also lists the last ``keep`` activated versions, so garbage collection keeps the
+    version servers may still be reading from rather than the newest directories.
+
+    :param base_path: ``CHROMA_PATH``
+    :param version: Version created by :func:`new_version` and fully written.
+    :param keep: Activated versions to keep, at least 1.
+    """
+    pointer = read_json(f"{base_path}/{POINTER_FILE}", default={})
+    history = [name for name in pointer.get("history", [pointer.get("version")]) if name and name != version]
+    history = (history + [version])[-max(keep, 1):]
+    write_json_atomic(f"{base_path}/{POINTER_FILE}",
+                      {"version": version, "history": history, "activated": datetime.now().isoformat()})
+    print(f"Activated index version {version}.")
+    collect_garbage(base_path)
+
+
+def collect_garbage(base_path: str) -> list[str]:
+    """
+    Delete versions that are neither among the recently activated ones recorded in the pointer nor
+    newer than the active version.
+
+    Keeping the previously active version gives running servers time to switch over before its
+    files disappear; newer versions may still be being built by another process. Directories of
+    builds that failed before activation are removed once a newer version is activated.
+
+    :param base_path: ``CHROMA_PATH``
+    :return: Deleted version names.
+    """
+    versions_dir = f"{base_path}/{VERSIONS_DIR}"
+    pointer = read_json(f"{base_path}/{POINTER_FILE}", default={})
+    active = pointer.get("version")
+    if not active or not os.path.isdir(versions_dir):
+        return []
+
+    keep = set(pointer.get("history", [])) | {active}
+    removed = sorted(entry.name for entry in os.scandir(versions_dir)
+                     if entry.is_dir() and entry.name not in keep and entry.name < active)
+    for version in removed:
+        shutil.rmtree(version_path(base_path, version), ignore_errors=True)
+        print(f"Removed index version {version}.")
+    return removed
+
+
+class VersionWatcher:
+    """
+    Cheap check whether the active version changed, for long-running readers.
+
+    The pointer file is looked at no more than every ``interval`` seconds, so calling :meth:`changed`
+    on every request costs one clock read most of the time.
+    """
+    def __init__(self, base_path: str, interval: float = INDEX_CHECK_INTERVAL):
+        self.base_path = base_path
+        self.interval = interval
+        self.path = active_path(base_path)
+        self.__checked = time.monotonic()
+
+    def changed(self) -> Optional[str]:
+        """
+        :return: Directory of the newly active version, or None if it is unchanged.
+        """
+        now = time.monotonic()
+        if now - self.__checked < self.interval:
+            return None
+        self.__checked = now
+
+        path = active_path(self.base_path)
+        if path == self.path:
+            return None
+        self.path = path
+        return path
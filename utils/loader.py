@@ -0,0 +1,131 @@
+import hashlib
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+from langchain_community.document_loaders import TextLoader, Docx2txtLoader
+from langchain_core.documents.base import Document
+
+from utils.index import read_json, walk_through_files, write_json_atomic
+
+DEFAULT_EXTENSIONS = ('.txt', '.md', '.docx')
+
+
+def file_md5(path: str) -> str:
+    """
+    Compute the MD5 hash of a file's bytes, reading it in blocks.
+
+    :param path: File path.
+    :return: Hex digest.
+    """
+    md5_hash_object = hashlib.md5()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            md5_hash_object.update(block)
+    return md5_hash_object.hexdigest()
+
+
+def extract_file(path: str, known_hash: Optional[str] = None) -> tuple[str, Optional[list[Document]]]:
+    """
+    Hash a file and extract its documents unless the hash equals ``known_hash``.
+
+    Runs inside worker processes, so it only takes and returns picklable values.
+
+    :param path: File path.
+    :param known_hash: Hash recorded for the file by a previous run.
+    :return: Tuple of the file hash and the extracted documents, or ``None`` if the content is unchanged.
+    """
+    digest = file_md5(path)
+    if digest == known_hash:
+        return digest, None
+
+    if path.endswith('docx'):
+        document_loader = Docx2txtLoader(path)
+    else:
+        document_loader = TextLoader(path, encoding="utf-8")
+    return digest, document_loader.load()
+
+
+class DocumentLoader:
+    """
+    Parallel, incremental loader for local ``.txt``/``.md``/``.docx`` corpora.
+
+    Files are extracted across a process pool and yielded as soon as each one is ready. With a
+    manifest, files whose mtime and size, or else content hash, match the previous run are skipped.
+    Progress is only recorded by :meth:`commit`, so documents that were yielded but never processed
+    successfully are loaded again next time.
+    """
+    def __init__(self, data_path: str,
+                 extensions: tuple[str, ...] = DEFAULT_EXTENSIONS,
+                 manifest_path: Optional[str] = None,
+                 max_workers: Optional[int] = None):
+        """
+        :param data_path: Root directory of the corpus.
+        :param extensions: File extensions to load.
+        :param manifest_path: JSON manifest of already processed files; ``None`` loads everything.
+        :param max_workers: Number of worker processes, ``None`` uses all CPUs.
+        """
+        self.data_path = data_path
+        self.extensions = tuple(ext if ext.startswith('.') else f'.{ext}' for ext in extensions)
+        self.manifest_path = manifest_path
+        self.max_workers = max_workers
+        self.__entries = read_json(manifest_path, default={}) if manifest_path else {}
+        self.__pending = {}
+        self.__seen = set()
+
+    def __files(self) -> Iterator[str]:
+        for extension in self.extensions:
+            yield from walk_through_files(self.data_path, extension)
+
+    def load(self) -> Iterator[Document]:
+        """
+        Yield documents of new and changed files in completion order.
+
+        :return: Iterator of documents.
+        """
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for path in self.__files():
+                stat = os.stat(path)
+                self.__seen.add(path)
+                entry = self.__entries.get(path)
+                if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                    continue
+                future = executor.submit(extract_file, path, entry['hash'] if entry else None)
+                futures[future] = (path, stat)
+
+            for future in as_completed(futures):
+                path, stat = futures[future]
+                try:
+                    digest, documents = future.result()
+                except Exception as ex:
+                    print(f"Cannot load a file {path}: {str(ex)}")
+                    continue
+
+                self.__pending[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': digest}
+                yield from documents or []
+
+    def removed_sources(self) -> list[str]:
+        """
+        List files recorded in the manifest that no longer exist in the corpus.
+
+        Only meaningful after :meth:`load` has been fully consumed.
+
+        :return: Paths of removed files.
+        """
+        return [path for path in self.__entries if path not in self.__seen]
+
+    def commit(self, forget_removed: bool = False) -> None:
+        """
+        Record the files yielded so far as processed and save the manifest.
+
+        :param forget_removed: Also drop manifest entries of files that no longer exist.
+        """
+        self.__entries.update(self.__pending)
+        self.__pending = {}
+        if forget_removed:
+            for path in self.removed_sources():
+                del self.__entries[path]
+        if self.manifest_path:
+            write_json_atomic(self.manifest_path, self.__entries)
@@ -0,0 +1,252 @@
+import bisect
+import math
+import os
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterable
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing counter.
+    """
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down, e.g. requests in flight or a queue depth.
+    """
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """
+        Increment the gauge for the duration of the block.
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram with fixed upper bounds, plus sum and count.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Collection of metrics rendered together in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self.__metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self.__metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self.__metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.__metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds", "Duration of RAG pipeline and script stages.", ["stage"]))
+STAGES_IN_FLIGHT = REGISTRY.register(Gauge(
+    "rag_stages_in_flight", "RAG pipeline stages currently running.", ["stage"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request duration.", ["method", "path", "status"]))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served."))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "rag_cache_requests_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"]))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "rag_queue_depth", "Items waiting in internal queues.", ["queue"]))
+CHAT_SESSIONS = REGISTRY.register(Gauge(
+    "rag_chat_sessions", "Chat sessions held in memory."))
+JOB_STAGE_SECONDS = REGISTRY.register(Gauge(
+    "rag_job_stage_duration_seconds", "Duration of each stage in the last run of a batch job.", ["job", "stage"]))
+JOB_LAST_RUN = REGISTRY.register(Gauge(
+    "rag_job_last_run_timestamp_seconds", "Unix time of the last run of a batch job.", ["job"]))
+EMBED_BATCH_SIZE = REGISTRY.register(Histogram(
+    "rag_embed_batch_size", "Texts per batched embedding request.", buckets=(1, 2, 4, 8, 16, 32, 64)))
+REWRITE_DECISIONS = REGISTRY.register(Counter(
+    "rag_rewrite_decisions_total", "Query rewrite decisions: rewrite, or the reason it was skipped.", ["decision"]))
+REWRITE_SECONDS_SAVED = REGISTRY.register(Counter(
+    "rag_rewrite_seconds_saved_total", "Estimated seconds saved by skipped query rewrites (mean rewrite latency per skip)."))
+STAGE_TIMEOUTS = REGISTRY.register(Counter(
+    "rag_stage_timeouts_total", "Pipeline stages cancelled by their timeout or the request deadline.", ["stage"]))
+REQUESTS_CANCELLED = REGISTRY.register(Counter(
+    "rag_requests_cancelled_total", "Chat requests abandoned before an answer, by reason (disconnect/deadline).",
+    ["reason"]))
+PROMPT_TOKENS = REGISTRY.register(Histogram(
+    "rag_prompt_tokens", "Estimated prompt tokens per chat request (with PROMPT_STATS).",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)))
+PROMPT_PREFIX_RATIO = REGISTRY.register(Histogram(
+    "rag_prompt_prefix_ratio", "Share of the prompt repeating the previous prompt of the session (with PROMPT_STATS).",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95)))
+
+
+class StageMetrics:
+    """
+    Stage listener (see :func:`utils.timing.add_stage_listener`) feeding stage histograms and in-flight gauges.
+    """
+    def on_stage_start(self, name: str) -> None:
+        STAGES_IN_FLIGHT.inc(stage=name)
+
+    def on_stage_end(self, name: str, elapsed: float) -> None:
+        STAGES_IN_FLIGHT.dec(stage=name)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+
+
+def write_textfile(path: str = None) -> None:
+    """
+    Write all metrics to a file for the node_exporter textfile collector.
+
+    Used by the batch scripts, which exit before they could be scraped. Does nothing unless a path is
+    given or ``METRICS_TEXTFILE`` is set.
+
+    :param path: Destination ``.prom`` file.
+    """
+    path = path or os.environ.get('METRICS_TEXTFILE')
+    if not path:
+        return
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+
+
+def report_job_timings(job: str, timings: dict) -> None:
+    """
+    Print the stage timings of a batch job run and export them via :func:`write_textfile`.
+
+    :param job: Job name, e.g. ``ingest`` or ``source_sync``.
+    :param timings: Stage name -> seconds, as collected by :func:`utils.timing.start_timings`.
+    """
+    for name, seconds in timings.items():
+        print(f"Stage '{name}' took {seconds:.2f}s")
+        JOB_STAGE_SECONDS.set(seconds, job=job, stage=name)
+    JOB_LAST_RUN.set(time.time(), job=job)
+    write_textfile()
+
+
+def server_timing(timings: dict, total: float = None) -> str:
+    """
+    Format stage timings as a ``Server-Timing`` header value.
+
+    :param timings: Stage name -> seconds.
+    :param total: Overall request duration in seconds.
+    :return: Header value, e.g. ``embed;dur=12.3, generate;dur=812.0``.
+    """
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,120 @@
+import os
+import re
+import zlib
+
+from typing import List
+
+import numpy as np
+from langchain_core.documents.base import Document
+
+NEAR_DUP_THRESHOLD = float(os.environ.get('NEAR_DUP_THRESHOLD', 0.9))
+NUM_PERMUTATIONS = 128
+SHINGLE_SIZE = 5
+
+MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+WORD_RE = re.compile(r"\w+")
+DIGITS_RE = re.compile(r"\d+")
+
+
+def lsh_params(threshold: float, num_perm: int = NUM_PERMUTATIONS) -> tuple[int, int]:
+    """
+    Pick the number of LSH bands and rows per band for a Jaccard threshold.
+
+    Chooses the split whose S-curve midpoint ``(1 / bands) ** (1 / rows)`` is closest to the
+    threshold, using all ``num_perm`` signature values.
+
+    :param threshold: Target Jaccard similarity.
+    :param num_perm: Signature length.
+    :return: Tuple of bands and rows.
+    """
+    candidates = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(candidates, key=lambda item: abs((1 / item[0]) ** (1 / item[1]) - threshold))
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    Hash the word n-grams of a text into 31-bit integers.
+
+    Text is lowercased and digits are masked, so chunks that differ only by dates or counters
+    produce the same shingles.
+
+    :param text: Chunk text.
+    :param size: Number of words per shingle.
+    :return: Array of unique shingle hashes.
+    """
+    words = WORD_RE.findall(DIGITS_RE.sub("0", text.lower()))
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+
+    grams = [" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))]
+    hashes = np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+    return np.unique(hashes % MERSENNE_PRIME)
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures with ``num_perm`` universal hash functions ``(a * x + b) mod p``.
+    """
+    def __init__(self, num_perm: int = NUM_PERMUTATIONS, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, int(MERSENNE_PRIME), size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.integers(0, int(MERSENNE_PRIME), size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Compute the signature of a set of shingle hashes.
+
+        :param hashes: Shingle hashes below the Mersenne prime, so products fit into uint64.
+        :return: Signature vector of length ``num_perm``.
+        """
+        if hashes.size == 0:
+            return np.full(self.num_perm, MERSENNE_PRIME, dtype=np.uint64)
+        return ((self.a * hashes[np.newaxis, :] + self.b) % MERSENNE_PRIME).min(axis=1)
+
+
+def remove_near_duplicates(chunks: List[Document],
+                           threshold: float = NEAR_DUP_THRESHOLD,
+                           num_perm: int = NUM_PERMUTATIONS) -> List[Document]:
+    """
+    Drop chunks whose estimated Jaccard similarity to an earlier chunk reaches ``threshold``.
+
+    Signatures are bucketed per LSH band, so each chunk is only compared against the kept chunks
+    sharing at least one band with it instead of against the whole corpus. The first chunk of every
+    near-duplicate group is kept, so the output preserves input order.
+
+    :param chunks: Chunks to deduplicate.
+    :param threshold: Jaccard similarity threshold in the (0, 1] range; ``0`` disables the stage.
+    :param num_perm: Signature length.
+    :return: Chunks without near duplicates.
+    """
+    if threshold <= 0 or len(chunks) < 2:
+        return chunks
+
+    bands, rows = lsh_params(threshold, num_perm)
+    hasher = MinHasher(num_perm)
+    buckets = [{} for _ in range(bands)]
+    signatures = []
+
+    unique_chunks = []
+    for chunk in chunks:
+        signature = hasher.signature(shingles(chunk.page_content))
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(buckets[band].get(key, ()))
+
+        if candidates:
+            kept = np.stack([signatures[idx] for idx in candidates])
+            if (kept == signature).mean(axis=1).max() >= threshold:
+                continue
+
+        idx = len(signatures)
+        signatures.append(signature)
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(idx)
+        unique_chunks.append(chunk)
+
+    print(f"Removed {len(chunks) - len(unique_chunks)} near-duplicate chunks (threshold {threshold}).")
+    return unique_chunks
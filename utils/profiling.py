@@ -0,0 +1,119 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pathlib
+import pstats
+import re
+import tracemalloc
+
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+root = pathlib.Path(__file__).parent.parent.resolve()
+PROFILE_PATH = f"{root}/logs/profiles"
+
+# Profiling is disabled unless a token is configured
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_QUERY_PARAM = "profile"
+TRACEMALLOC_FRAMES = 25
+
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+$")
+LABEL_RE = re.compile(r"[^\w-]+")
+
+_lock = asyncio.Lock()
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """
+    Check a token against ``PROFILE_TOKEN`` in constant time; always False when profiling is disabled.
+
+    :param token: Token from the request.
+    :return: True if the token grants access.
+    """
+    return bool(PROFILE_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def list_profiles() -> list[dict]:
+    """
+    List stored profile files, newest first.
+
+    :return: List of dictionaries with name, size and creation time.
+    """
+    if not os.path.isdir(PROFILE_PATH):
+        return []
+
+    profiles = []
+    for entry in os.scandir(PROFILE_PATH):
+        if entry.is_file():
+            stat = entry.stat()
+            profiles.append({"name": entry.name, "size": stat.st_size,
+                             "created": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds")})
+    return sorted(profiles, key=lambda item: item["created"], reverse=True)
+
+
+def profile_file(name: str) -> Optional[str]:
+    """
+    Resolve a stored profile name to its path, rejecting anything outside the profiles folder.
+
+    :param name: File name as returned by :func:`list_profiles`.
+    :return: Absolute path, or None if the name is invalid or missing.
+    """
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = f"{PROFILE_PATH}/{name}"
+    return path if os.path.isfile(path) else None
+
+
+def _save(base: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot) -> None:
+    """
+    Store the cProfile stats, the allocation snapshot and a readable summary under the given base name.
+    """
+    os.makedirs(PROFILE_PATH, exist_ok=True)
+    profiler.dump_stats(f"{PROFILE_PATH}/{base}.prof")
+    snapshot.dump(f"{PROFILE_PATH}/{base}.tracemalloc")
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+    summary.write("\nTop allocations by line\n")
+    for stat in snapshot.statistics("lineno")[:25]:
+        summary.write(f"{stat}\n")
+    with open(f"{PROFILE_PATH}/{base}.txt", "w") as file:
+        file.write(summary.getvalue())
+
+
+@asynccontextmanager
+async def profiled(label: str) -> AsyncIterator[Optional[str]]:
+    """
+    Run the body under cProfile and tracemalloc and store the results under ``logs/profiles/`` on exit.
+
+    The profilers are process-wide, so coroutines of other requests running at the same time show up in
+    the profile too. Only one body is profiled at a time; while one is running, others run normally.
+    The name is chosen up front, so it can be sent in response headers before a streamed body is done.
+
+    :param label: Short description used in the file names, e.g. the request path.
+    :return: Base name the profile will be stored under, or None if another profile is running.
+    """
+    if _lock.locked():
+        yield None
+        return
+
+    async with _lock:
+        slug = LABEL_RE.sub("_", label).strip("_")[:40]
+        base = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}"
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield base
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracemalloc:
+                tracemalloc.stop()
+            await asyncio.to_thread(_save, base, profiler, snapshot)
@@ -0,0 +1,87 @@
+import os
+
+from collections import OrderedDict
+from typing import List, Tuple
+
+from langchain_core.messages import BaseMessage
+
+from utils.chunking import count_tokens
+from utils.metrics import PROMPT_PREFIX_RATIO, PROMPT_TOKENS
+
+# Report prompt sizes and prefix reuse for every chat request
+PROMPT_STATS = os.environ.get('PROMPT_STATS', '').lower() in ('1', 'true', 'yes')
+PROMPT_STATS_SESSIONS = 10_000
+
+
+def prompt_text(messages: List[BaseMessage]) -> str:
+    """
+    Render chat messages roughly the way a chat template lays them out before tokenization.
+    """
+    return "".join(f"<|{message.type}|>\n{message.content}\n" for message in messages)
+
+
+def shared_prefix_length(first: str, second: str) -> int:
+    """
+    Length of the common prefix of two strings.
+    """
+    limit = min(len(first), len(second))
+    idx = 0
+    # Compare in blocks first, most of a repeated prompt is identical
+    while idx + 256 <= limit and first[idx:idx + 256] == second[idx:idx + 256]:
+        idx += 256
+    while idx < limit and first[idx] == second[idx]:
+        idx += 1
+    return idx
+
+
+class PromptStats:
+    """
+    Measure prompt tokens per request and how much of each prompt repeats the previous prompt of the
+    same session, or the latest prompt of any session for the first turn.
+
+    An inference server with a prefix (KV) cache, such as LM Studio or llama.cpp, only re-processes the
+    tokens after the longest prefix shared with the prompt it served before, so the prefix ratio is the
+    share of prompt processing the cache can skip.
+    """
+    def __init__(self, max_sessions: int = PROMPT_STATS_SESSIONS):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.prefix_tokens = 0
+        self.__max_sessions = max_sessions
+        self.__last: OrderedDict[str, str] = OrderedDict()
+
+    def record(self, session_id: str, messages: List[BaseMessage]) -> Tuple[int, int]:
+        """
+        Record the prompt of a request.
+
+        :param session_id: Chat session identifier.
+        :param messages: Prompt messages as sent to the model.
+        :return: Tuple of prompt tokens and tokens shared with the previous prompt of the session.
+        """
+        text = prompt_text(messages)
+        latest = next(reversed(self.__last.values()), "")
+        previous = self.__last.pop(session_id, latest)
+        self.__last[session_id] = text
+        if len(self.__last) > self.__max_sessions:
+            self.__last.popitem(last=False)
+
+        tokens = count_tokens(text)
+        prefix = count_tokens(text[:shared_prefix_length(previous, text)])
+        self.requests += 1
+        self.prompt_tokens += tokens
+        self.prefix_tokens += prefix
+        PROMPT_TOKENS.observe(tokens)
+        PROMPT_PREFIX_RATIO.observe(prefix / tokens if tokens else 0.0)
+        return tokens, prefix
+
+    def summary(self) -> dict:
+        """
+        Totals over all recorded requests.
+
+        :return: Dictionary with request count, mean prompt tokens and the overall reusable-prefix ratio.
+        """
+        return {
+            "requests": self.requests,
+            "mean_prompt_tokens": self.prompt_tokens / self.requests if self.requests else 0.0,
+            "prefix_ratio": self.prefix_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+        }
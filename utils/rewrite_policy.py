@@ -0,0 +1,88 @@
+import os
+import re
+
+from typing import Optional
+
+from utils.metrics import REWRITE_DECISIONS, REWRITE_SECONDS_SAVED
+
+# Skip the rewrite when the first search already found a chunk scoring at least this (above 1 disables)
+REWRITE_SKIP_SCORE = float(os.environ.get('REWRITE_SKIP_SCORE', 0.8))
+# Minimum words for a question to count as self-contained (0 disables the heuristic)
+REWRITE_SELF_CONTAINED_WORDS = int(os.environ.get('REWRITE_SELF_CONTAINED_WORDS', 6))
+
+# Words that usually point back to earlier turns
+REFERRING_WORDS = frozenset("""
+it its it's itself they them their theirs this that these those he him his she her there here
+above previous former latter same such other another else more also too again one ones
+""".split())
+FOLLOW_UP_RE = re.compile(r"^(and|but|so|or|also|then|what about|how about|why|why not|ok|okay|yes|no)\b", re.IGNORECASE)
+WORD_RE = re.compile(r"[\w']+")
+
+# Weight of the newest observation in the running mean rewrite latency
+LATENCY_SMOOTHING = 0.1
+
+
+def is_self_contained(question: str, min_words: int = REWRITE_SELF_CONTAINED_WORDS) -> bool:
+    """
+    Cheap check that a question can be searched without the conversation: long enough, not opening
+    like a follow-up and free of pronouns or other words referring to earlier turns.
+
+    :param question: User question.
+    :param min_words: Minimum number of words, 0 disables the check.
+    :return: True if the question looks self-contained.
+    """
+    words = [word.lower() for word in WORD_RE.findall(question)]
+    if min_words <= 0 or len(words) < min_words:
+        return False
+    return not FOLLOW_UP_RE.match(question.strip()) and not REFERRING_WORDS.intersection(words)
+
+
+class RewritePolicy:
+    """
+    Decides whether a question needs the LLM query rewrite before the second search.
+
+    Decisions are counted in ``decisions`` and ``rag_rewrite_decisions_total``. For every skipped rewrite
+    the running mean latency of the rewrites actually made is added to ``seconds_saved`` and
+    ``rag_rewrite_seconds_saved_total``.
+    """
+    def __init__(self, skip_score: float = REWRITE_SKIP_SCORE, self_contained_words: int = REWRITE_SELF_CONTAINED_WORDS):
+        self.skip_score = skip_score
+        self.self_contained_words = self_contained_words
+        self.mean_latency: Optional[float] = None
+        self.decisions = {}
+        self.seconds_saved = 0.0
+
+    def skip_reason(self, has_history: bool, top_score: float, question: str) -> Optional[str]:
+        """
+        Decide whether to skip the rewrite and count the decision.
+
+        :param has_history: Whether the session has earlier turns or a summary.
+        :param top_score: Best relevance score of the search with the original question.
+        :param question: User question.
+        :return: Reason to skip the rewrite (``no_history``, ``high_score``, ``self_contained``), or None to rewrite.
+        """
+        if not has_history:
+            reason = "no_history"
+        elif top_score >= self.skip_score:
+            reason = "high_score"
+        elif is_self_contained(question, self.self_contained_words):
+            reason = "self_contained"
+        else:
+            reason = None
+
+        decision = reason or "rewrite"
+        self.decisions[decision] = self.decisions.get(decision, 0) + 1
+        REWRITE_DECISIONS.inc(decision=decision)
+        if reason and self.mean_latency is not None:
+            self.seconds_saved += self.mean_latency
+            REWRITE_SECONDS_SAVED.inc(self.mean_latency)
+        return reason
+
+    def observe(self, elapsed: float) -> None:
+        """
+        Record the latency of a rewrite that was made, including its search.
+        """
+        if self.mean_latency is None:
+            self.mean_latency = elapsed
+        else:
+            self.mean_latency += LATENCY_SMOOTHING * (elapsed - self.mean_latency)
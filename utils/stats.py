@@ -0,0 +1,43 @@
+import math
+
+from typing import Iterable
+
+
+def percentile(values: Iterable[float], q: float) -> float:
+    """
+    Compute a percentile with linear interpolation between closest ranks.
+
+    :param values: Sample values.
+    :param q: Percentile in the 0-100 range.
+    :return: Percentile value, or 0.0 for an empty sample.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+
+    rank = (len(ordered) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: Iterable[float]) -> dict:
+    """
+    Summarize a sample with count, mean, p50/p95/p99 and max.
+
+    :param values: Sample values.
+    :return: Dictionary of summary statistics.
+    """
+    values = list(values)
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
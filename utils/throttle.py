@@ -0,0 +1,78 @@
+import asyncio
+import random
+import time
+
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class AsyncRateLimiter:
+    """
+    Spaces calls evenly so that no more than ``requests_per_minute`` start per minute.
+
+    Callers ``await limiter.acquire()`` before each request; a value of ``0`` disables the limit.
+    """
+    def __init__(self, requests_per_minute: float):
+        self.__interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.__next_slot = 0.0
+        self.__lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """
+        Wait until the next request slot is available.
+        """
+        if not self.__interval:
+            return
+
+        async with self.__lock:
+            now = time.monotonic()
+            wait = self.__next_slot - now
+            self.__next_slot = max(now, self.__next_slot) + self.__interval
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def is_rate_limit_error(ex: BaseException) -> bool:
+    """
+    Check whether an exception is a provider rate-limit (HTTP 429) error.
+
+    Works for the OpenAI-compatible clients behind ``ChatOpenAI``/``ChatTogether`` and for httpx errors
+    without importing either library.
+
+    :param ex: Raised exception.
+    :return: True if the request should be retried later.
+    """
+    if type(ex).__name__ == "RateLimitError":
+        return True
+    response = getattr(ex, "response", None)
+    return getattr(ex, "status_code", None) == 429 or getattr(response, "status_code", None) == 429
+
+
+async def retry_with_backoff(call: Callable[[], Awaitable[T]],
+                             max_retries: int = 5,
+                             base_delay: float = 2.0,
+                             max_delay: float = 60.0,
+                             retry_if: Callable[[BaseException], bool] = is_rate_limit_error) -> T:
+    """
+    Await ``call()`` and retry it with exponential backoff and jitter while ``retry_if`` matches the error.
+
+    :param call: Factory returning a fresh awaitable for each attempt.
+    :param max_retries: Number of retries after the first attempt.
+    :param base_delay: Delay before the first retry, in seconds; doubled on every retry.
+    :param max_delay: Upper bound for a single delay, in seconds.
+    :param retry_if: Predicate deciding whether an error is retryable.
+    :return: Result of the first successful attempt.
+    :raises Exception: The last error if it is not retryable or retries are exhausted.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as ex:
+            if attempt >= max_retries or not retry_if(ex):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
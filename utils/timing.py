@@ -0,0 +1,78 @@
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Protocol
+
+_timings: ContextVar[Optional[dict]] = ContextVar("stage_timings", default=None)
+
+
+class StageListener(Protocol):
+    def on_stage_start(self, name: str) -> None: ...
+
+    def on_stage_end(self, name: str, elapsed: float) -> None: ...
+
+
+_listeners: list[StageListener] = []
+
+
+def add_stage_listener(listener: StageListener) -> None:
+    """
+    Register a listener notified when any stage starts and ends.
+
+    :param listener: Object implementing ``on_stage_start``/``on_stage_end``.
+    """
+    _listeners.append(listener)
+
+
+def remove_stage_listener(listener: StageListener) -> None:
+    """
+    Unregister a listener added by :func:`add_stage_listener`.
+    """
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def start_timings() -> dict:
+    """
+    Start collecting stage timings for the current context (a request or a script run).
+
+    Tasks created from this context share the returned dictionary, so stages running in child
+    tasks are accounted to the same request.
+
+    :return: Dictionary filled with ``stage name -> total seconds``.
+    """
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def current_timings() -> Optional[dict]:
+    """
+    Return the timings dictionary of the current context, if collection was started.
+    """
+    return _timings.get()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a pipeline stage.
+
+    The elapsed time is added to the current context's timings (repeated stages accumulate) and
+    reported to the registered listeners.
+
+    :param name: Stage name, e.g. ``embed`` or ``generate``.
+    """
+    for listener in _listeners:
+        listener.on_stage_start(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+        for listener in _listeners:
+            listener.on_stage_end(name, elapsed)
@@ -0,0 +1,139 @@
+import json
+import os
+import pathlib
+import queue
+import random
+import threading
+import time
+import uuid
+
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from utils.timing import current_timings, start_timings
+
+root = pathlib.Path(__file__).parent.parent.resolve()
+TRACE_PATH = f"{root}/logs"
+
+# Share of requests traced regardless of outcome; errors and slow requests are always traced
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.05))
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', 8000))
+
+_current: ContextVar[Optional["RequestTrace"]] = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """
+    Structured trace of a single chat request.
+
+    Recording only stores references (ids, scores, counts); nothing is formatted or serialized until
+    the trace is kept, and then only on the writer thread.
+    """
+    def __init__(self, session_id: str, sampled: bool):
+        self.trace_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.sampled = sampled
+        self.started = time.time()
+        self.duration = 0.0
+        self.timings = current_timings()
+        if self.timings is None:
+            self.timings = start_timings()
+        self.attributes = {}
+        self.searches = {}
+        self.error: Optional[BaseException] = None
+
+    def set(self, key: str, value) -> None:
+        """
+        Record a scalar attribute, e.g. the rewritten query or a token count.
+        """
+        self.attributes[key] = value
+
+    def record_chunks(self, name: str, docs_with_scores: list) -> None:
+        """
+        Record the chunks returned by a search step as (chunk id, score) pairs.
+
+        :param name: Step name, e.g. ``original`` or ``chosen``.
+        :param docs_with_scores: List of tuples starting with (Document, score).
+        """
+        self.searches[name] = [(item[0].id, item[1]) for item in docs_with_scores]
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "session_id": self.session_id,
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="milliseconds"),
+            "duration_ms": round(self.duration * 1000, 1),
+            "sampled": self.sampled,
+            "error": f"{type(self.error).__name__}: {self.error}" if self.error else None,
+            "timings_ms": {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()},
+            "attributes": self.attributes,
+            "chunks": {name: [{"id": chunk_id, "score": round(float(score), 4)} for chunk_id, score in chunks]
+                       for name, chunks in self.searches.items()},
+        }
+
+
+class TraceWriter:
+    """
+    Background thread appending kept traces as JSON lines to ``logs/traces-YYYYMMDD.jsonl``.
+    """
+    def __init__(self, path: str = TRACE_PATH):
+        self.path = path
+        self.__queue = queue.SimpleQueue()
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+    def submit(self, trace: RequestTrace) -> None:
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, name="trace-writer", daemon=True)
+                self.__thread.start()
+        self.__queue.put(trace)
+
+    def __run(self) -> None:
+        while True:
+            trace = self.__queue.get()
+            try:
+                line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+                with open(f"{self.path}/traces-{datetime.now().strftime('%Y%m%d')}.jsonl", "a") as file:
+                    file.write(line + "\n")
+            except Exception as ex:
+                print(f"Cannot write trace {trace.trace_id}: {ex}")
+
+
+writer = TraceWriter()
+
+
+def start_trace(session_id: str) -> RequestTrace:
+    """
+    Start a trace for the current request; it is sampled with probability ``TRACE_SAMPLE_RATE``.
+
+    :param session_id: Chat session identifier.
+    :return: RequestTrace
+    """
+    trace = RequestTrace(session_id, sampled=random.random() < TRACE_SAMPLE_RATE)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """
+    Return the trace of the current request, if one was started.
+    """
+    return _current.get()
+
+
+def finish_trace(trace: RequestTrace) -> bool:
+    """
+    Close a trace and queue it for writing if it was sampled, failed or was slower than ``TRACE_SLOW_MS``.
+
+    :param trace: Trace to finish.
+    :return: True if the trace is kept.
+    """
+    trace.duration = time.time() - trace.started
+    keep = trace.sampled or trace.error is not None or trace.duration * 1000 >= TRACE_SLOW_MS
+    if keep:
+        # The request may go on recording stages, e.g. in tasks it started; the writer gets a snapshot
+        trace.timings = dict(trace.timings)
+        writer.submit(trace)
+    return keep